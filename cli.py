@@ -3,80 +3,366 @@ cli.py – Updated CLI interface for scale logger
 """
 
 import argparse
-from scale_logger import db
+import os
+import sys
 
 
-def parse_args():
-    parser = argparse.ArgumentParser(description="Food Logger CLI")
-    subparsers = parser.add_subparsers(dest="command")
+def _log_args(p):
+    p.add_argument("--weight", type=float, required=True)
+    p.add_argument("--type", required=True, help="Food type (Produce, Dry, etc.)")
+    p.add_argument("--source", required=True, help="Donation source")
+
+
+def _report_args(p):
+    p.add_argument("--source", required=True)
+    p.add_argument("--start", help="Start date (YYYY-MM-DD)")
+    p.add_argument("--end", help="End date (YYYY-MM-DD)")
+
+
+def _summary_args(p):
+    p.add_argument("--by", default="source,type",
+                   help="Comma-separated dimensions: source, type, day, week, month "
+                        "(default: source,type)")
+    p.add_argument("--start", help="Start date (YYYY-MM-DD)")
+    p.add_argument("--end", help="End date (YYYY-MM-DD)")
+    p.add_argument("--source", action="append", help="Only this source (repeatable)")
+    p.add_argument("--type", action="append", help="Only this type (repeatable)")
+    p.add_argument("--running", action="store_true",
+                   help="Add a running total along the day/week/month dimension")
+    p.add_argument("--csv", action="store_true", help="Print CSV instead of a table")
+
+
+def _add_source_args(p):
+    p.add_argument("--name", required=True)
+
+
+def _show_args(p):
+    p.add_argument("--all", action="store_true", help="Include deleted entries")
+    p.add_argument("--limit", type=int, help="Stop after this many entries")
+    p.add_argument("--since", help="First date (YYYY-MM-DD)")
+    p.add_argument("--until", help="Last date (YYYY-MM-DD)")
+    p.add_argument("--source")
+    p.add_argument("--type")
+    p.add_argument("--page-size", type=int, default=500, help="Rows fetched per query")
+
+
+def _import_args(p):
+    p.add_argument("path")
+    p.add_argument("--format", choices=["csv", "jsonl"], help="Default: from the file extension")
+
+
+def _import_legacy_args(p):
+    p.add_argument("paths", nargs="+", metavar="CSV")
+    p.add_argument("--sources-json", help="Legacy sources.json to add first")
+    p.add_argument("--batch-size", type=int, help="Rows per transaction (default 5000)")
+
+
+def _export_args(p):
+    p.add_argument("--start", required=True, help="Start date (YYYY-MM-DD)")
+    p.add_argument("--end", help="End date (YYYY-MM-DD), default: start")
+    p.add_argument("--out", default="Backups", help="Output directory (default: Backups)")
+
+
+def _sync_export_args(p):
+    p.add_argument("--to", required=True, metavar="PEER", help="Name of the receiving station")
+    p.add_argument("--out", default="Sync", help="Output directory (default: Sync)")
+
+
+def _sync_import_args(p):
+    p.add_argument("paths", nargs="+", metavar="PATH", help="Change-set files or directories")
+
+
+def _sync_status_args(p):
+    p.add_argument("--name", help="Rename this station")
+
+
+def _archive_args(p):
+    p.add_argument("years", nargs="*", type=int, metavar="YEAR",
+                   help="Years to archive (none: list the archives)")
+    p.add_argument("--no-vacuum", action="store_true",
+                   help="Don't compact the main database afterwards")
+
 
-    log = subparsers.add_parser("log", help="Log a new food entry")
-    log.add_argument("--weight", type=float, required=True)
-    log.add_argument("--type", required=True, help="Food type (Produce, Dry, etc.)")
-    log.add_argument("--source", required=True, help="Donation source")
+def _daemon_args(p):
+    p.add_argument("--no-scale", action="store_true", help="Don't open the scale")
+    p.add_argument("--dashboard", type=int, nargs="?", const=8765, metavar="PORT",
+                   help="Also serve the live dashboard (default port 8765)")
 
-    subparsers.add_parser("delete-last", help="Mark the last entry as deleted")
-    subparsers.add_parser("undelete-last", help="Unmark the most recently deleted entry")
 
-    report = subparsers.add_parser("report", help="Generate report by source and date")
-    report.add_argument("--source", required=True)
-    report.add_argument("--start", help="Start date (YYYY-MM-DD)")
-    report.add_argument("--end", help="End date (YYYY-MM-DD)")
+def _dashboard_args(p):
+    p.add_argument("--port", type=int, default=8765)
 
-    subparsers.add_parser("list-sources", help="List available sources")
 
-    addsrc = subparsers.add_parser("add-source", help="Add a new donation source")
-    addsrc.add_argument("--name", required=True)
+def _stats_args(p):
+    p.add_argument("--file", help="Stats dump file (default: scale_logger/stats.jsonl)")
+    p.add_argument("--json", action="store_true", help="Print the raw snapshot")
 
-    show = subparsers.add_parser("show", help="Show log entries")
-    show.add_argument("--all", action="store_true", help="Include deleted entries")
 
-    return parser.parse_args()
+def _verify_rollup_args(p):
+    p.add_argument("--rebuild", action="store_true", help="Rebuild daily_totals if they differ")
+
+
+# Commands that --daemon sends to a running daemon instead of the database.
+DAEMON_COMMANDS = ("log", "delete-last", "undelete-last", "report", "summary",
+                   "list-sources", "export")
+
+# name -> (help, function adding the command's arguments or None)
+COMMANDS = {
+    "log": ("Log a new food entry", _log_args),
+    "delete-last": ("Mark the last entry as deleted", None),
+    "undelete-last": ("Unmark the most recently deleted entry", None),
+    "report": ("Generate report by source and date", _report_args),
+    "summary": ("Total weight grouped by source/type/day/week/month", _summary_args),
+    "list-sources": ("List available sources", None),
+    "add-source": ("Add a new donation source", _add_source_args),
+    "show": ("Show log entries, newest first", _show_args),
+    "import": ("Bulk-load entries from a CSV or JSONL file", _import_args),
+    "import-legacy": ("Migrate old_SLFPScale weights.csv files", _import_legacy_args),
+    "export": ("Write one CSV per source for a date range", _export_args),
+    "sync-export": ("Write entries new since the last sync to a peer station", _sync_export_args),
+    "sync-import": ("Apply change sets from other stations", _sync_import_args),
+    "sync-status": ("Show this station and its sync peers", _sync_status_args),
+    "archive": ("Move closed years into per-year archive files", _archive_args),
+    "daemon": ("Run the logging daemon on a Unix socket", _daemon_args),
+    "dashboard": ("Serve today's totals as a live web page on localhost", _dashboard_args),
+    "stats": ("Show the latest call/latency stats dump", _stats_args),
+    "check-plans": ("Fail if a hot query falls back to a table scan", None),
+    "verify-rollup": ("Diff daily_totals against the raw log", _verify_rollup_args),
+}
+
+
+def parse_args(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(description="Food Logger CLI")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Send the command to a running daemon (" + ", ".join(DAEMON_COMMANDS) + ")")
+    parser.add_argument("--socket", help="Daemon socket (default: scale_logger/foodlog.sock)")
+    subparsers = parser.add_subparsers(dest="command")
+    # Build a subparser for the command being run only: creating all of
+    # them is most of argparse's share of startup time. --help and unknown
+    # commands get the full list.
+    command = next((a for a in argv if a in COMMANDS), None)
+    for name in [command] if command in COMMANDS else COMMANDS:
+        help_text, add_arguments = COMMANDS[name]
+        sub = subparsers.add_parser(name, help=help_text)
+        if add_arguments:
+            add_arguments(sub)
+    return parser.parse_args(argv)
 
 
 def main():
     args = parse_args()
-    db.initialize_db()
+    if args.daemon:
+        # One socket round trip per command; the daemon has the database
+        # open already.
+        from scale_logger import daemon
+        if args.command not in DAEMON_COMMANDS:
+            sys.exit(f"'{args.command}' can't be sent to the daemon; "
+                     f"use one of {', '.join(DAEMON_COMMANDS)}.")
+        store = daemon.Client(args.socket or daemon.SOCKET_PATH)
+    else:
+        # Imported here so that --daemon clients never load sqlite3.
+        from scale_logger import db
+        db.initialize_db()
+        store = db
 
     if args.command == "log":
-        db.log_entry(args.weight, args.type, args.source)
+        store.log_entry(args.weight, args.type, args.source)
         print("✅ Entry logged.")
 
     elif args.command == "delete-last":
-        db.delete_last_entry()
-        print("🗑️ Last entry marked deleted.")
+        if store.delete_last_entry() is None:
+            print("Nothing to delete.")
+        else:
+            print("🗑️ Last entry marked deleted.")
 
     elif args.command == "undelete-last":
-        db.undelete_last()
-        print("♻️ Undeletion complete.")
+        if store.undelete_last_entry() is None:
+            print("Nothing to undelete.")
+        else:
+            print("♻️ Undeletion complete.")
 
     elif args.command == "report":
-        totals, total_weight, rows = db.create_report(args.source, args.start, args.end)
+        totals, total_weight, rows = store.create_report(args.source, args.start, args.end)
         print(f"📊 Report for '{args.source}'")
         print(f"Total weight: {total_weight:.2f} lbs")
-        for cat, weight in totals:
+        for cat, weight in totals.items():
             print(f" - {cat}: {weight:.2f} lbs")
         print(" Entry breakdown:")
         for row in rows:
-            print(row)
+            print(tuple(row))
+
+    elif args.command == "summary":
+        group_by = tuple(g.strip() for g in args.by.split(",") if g.strip())
+        columns, rows = store.aggregate(group_by, args.start, args.end, args.source, args.type,
+                                        running_total=args.running)
+        if args.csv:
+            import csv
+            writer = csv.writer(sys.stdout)
+            writer.writerow(columns)
+            writer.writerows(rows)
+        elif not rows:
+            print("No logs found.")
+        else:
+            cells = [[f"{v:.1f}" if isinstance(v, float) else str(v) for v in row] for row in rows]
+            widths = [max(len(c), *(len(r[i]) for r in cells)) for i, c in enumerate(columns)]
+            n = len(group_by)
+            print("  ".join(c.ljust(w) if i < n else c.rjust(w)
+                            for i, (c, w) in enumerate(zip(columns, widths))))
+            for r in cells:
+                print("  ".join(v.ljust(w) if i < n else v.rjust(w)
+                                for i, (v, w) in enumerate(zip(r, widths))))
 
     elif args.command == "add-source":
-        conn = db.get_connection()
-        conn.execute("INSERT OR IGNORE INTO sources (name) VALUES (?)", (args.name,))
-        conn.commit()
+        db.add_source(args.name)
         print(f"✅ Source '{args.name}' added.")
 
     elif args.command == "list-sources":
-        sources = db.get_sources()
+        sources = store.get_sources()
         print("📚 Available Sources:")
         for s in sources:
             print(f" - {s}")
 
     elif args.command == "show":
-        rows = db.get_all_logs(include_deleted=args.all)
-        for row in rows:
+        import itertools
+        rows = db.iter_logs(source=args.source, dtype=args.type,
+                            since=args.since, until=args.until,
+                            action=None if args.all else "record",
+                            page_size=args.page_size)
+        for row in itertools.islice(rows, args.limit):
             print(row)
 
+    elif args.command == "import":
+        from scale_logger import importer
+        inserted, failures, seconds = importer.import_file(args.path, args.format)
+        for index, entry, error in failures[:20]:
+            print(f"❌ row {index + 1}: {error}")
+        if len(failures) > 20:
+            print(f"   ... and {len(failures) - 20} more")
+        rate = inserted / seconds if seconds else 0
+        print(f"✅ Imported {inserted} entries ({len(failures)} skipped) "
+              f"in {seconds:.2f}s ({rate:,.0f} rows/s).")
+
+    elif args.command == "import-legacy":
+        from scale_logger import legacy
+
+        def show_progress(stats):
+            rate = stats["imported"] / stats["seconds"] if stats["seconds"] else 0
+            print(f"   {stats['rows']:,} rows read, {stats['imported']:,} imported ({rate:,.0f} rows/s)")
+
+        if args.sources_json:
+            print(f"📚 {legacy.load_sources_json(args.sources_json)} sources loaded.")
+        stats = legacy.import_legacy_csvs(
+            args.paths, args.batch_size or legacy.BATCH_SIZE, show_progress)
+        for path, line, error in stats["errors"][:20]:
+            print(f"❌ {path}:{line}: {error}")
+        rate = stats["rows"] / stats["seconds"] if stats["seconds"] else 0
+        print(f"✅ {stats['files']} file(s), {stats['rows']:,} rows in {stats['seconds']:.2f}s "
+              f"({rate:,.0f} rows/s): {stats['imported']:,} imported, "
+              f"{stats['duplicates']:,} already imported, {len(stats['errors'])} errors.")
+
+    elif args.command == "export":
+        if args.daemon:
+            exporter = store
+        else:
+            from scale_logger import export as exporter
+        written = exporter.export_per_source_csvs(args.start, args.end or args.start,
+                                                  os.path.abspath(args.out))
+        for source, (path, count, _totals) in written.items():
+            print(f" - {source}: {count} entries -> {path}")
+        if written:
+            print(f"✅ {len(written)} CSV(s) saved under {args.out}")
+        else:
+            print(f"No logs found between {args.start} and {args.end or args.start}.")
+
+    elif args.command == "sync-export":
+        from scale_logger import sync
+        written = sync.export_changes(args.to, args.out)
+        for path, rows, removed in written:
+            print(f" - {path}: {rows} entries, {removed} removals")
+        print(f"✅ {len(written)} change set(s) for '{args.to}'." if written
+              else f"Nothing new for '{args.to}'.")
+
+    elif args.command == "sync-import":
+        import glob
+        from scale_logger import sync
+        paths = []
+        for path in args.paths:
+            if os.path.isdir(path):
+                paths.extend(sorted(glob.glob(os.path.join(path, "*.jsonl.gz"))))
+            else:
+                paths.append(path)
+        result = sync.import_changes(paths)
+        print(f"✅ {result['files']} change set(s) applied, {result['skipped']} already applied or our own: "
+              f"{result['inserted']} new entries ({result['rows'] - result['inserted']} duplicates), "
+              f"{result['removed']} removals.")
+
+    elif args.command == "sync-status":
+        from scale_logger import sync
+        if args.name:
+            sync.set_station_name(args.name)
+        uid, name = sync.station()
+        print(f"🏠 Station '{name}' ({uid})")
+        for peer, peer_uid, sent_id, _ in sync.peers():
+            print(f" - {peer}: sent through entry {sent_id}" + ("" if peer_uid else " (never imported from)"))
+
+    elif args.command == "archive":
+        from scale_logger import archive
+        for year in args.years:
+            moved = archive.archive_year(year, vacuum=not args.no_vacuum)
+            print(f"📦 {year}: {moved} entries moved to {archive.archive_file(year)}")
+        for year, path, rows, archived_at in archive.archives():
+            print(f" - {year}: {rows} entries in {path} (archived {archived_at})")
+        if not args.years and not archive.archives():
+            print("No archived years.")
+
+    elif args.command == "daemon":
+        from scale_logger import daemon
+        daemon.run(args.socket or daemon.SOCKET_PATH, open_scale=not args.no_scale,
+                   dashboard_port=args.dashboard)
+
+    elif args.command == "dashboard":
+        from scale_logger import dashboard
+        dashboard.run(args.port)
+
+    elif args.command == "stats":
+        import json
+        from datetime import datetime
+        from scale_logger import stats
+        dump = stats.load_last_snapshot(args.file or stats.DUMP_PATH)
+        if dump is None:
+            print("No stats dump found. Run the GUI with FOODLOG_STATS=1 to collect one.")
+        elif args.json:
+            print(json.dumps(dump, indent=2))
+        else:
+            taken = datetime.fromtimestamp(dump["time"]).isoformat(sep=" ", timespec="seconds")
+            print(f"📈 Stats from pid {dump['pid']} at {taken}")
+            print(stats.format_table(dump["stats"]))
+            for name, values in dump.get("counters", {}).items():
+                print(f"{name}: " + ", ".join(f"{k}={v}" for k, v in values.items()))
+
+    elif args.command == "check-plans":
+        from scale_logger import queryplan
+        failures = queryplan.check_query_plans()
+        for name, steps in failures.items():
+            print(f"❌ {name}: " + "; ".join(steps))
+        if failures:
+            sys.exit(1)
+        count = len(db.HOT_QUERIES) + len(db.ROLLUP_QUERIES)
+        print(f"✅ All {count} hot queries use an index.")
+
+    elif args.command == "verify-rollup":
+        diffs = db.verify_daily_totals()
+        for day, source, dtype, expected, actual in diffs:
+            print(f"❌ {day} {source} / {dtype}: log says {expected}, rollup says {actual}")
+        if not diffs:
+            print("✅ daily_totals matches the log.")
+        elif args.rebuild:
+            db.rebuild_daily_totals()
+            print(f"♻️ Rebuilt daily_totals ({len(diffs)} groups were off).")
+        else:
+            sys.exit(1)
+
     else:
         print("⚠️ No valid command provided. Use --help to see options.")
 
@@ -1,15 +1,131 @@
+import time
+_process_start = time.perf_counter()
+
 import tkinter as tk
 from tkinter import ttk, messagebox
-from tkcalendar import DateEntry
-from tkinter import filedialog
-from PIL import Image, ImageTk
 from datetime import datetime
+import itertools
 import os
-import csv
+import queue
+import threading
 import scale_logger.db as db
+from scale_logger import scale, stats, totals
+# tkcalendar, PIL, tkinter.filedialog and scale_logger.export are imported
+# where they are first needed, so they don't delay the main window.
 
 LOGO1_PATH = "assets/slfp_logo.png"
 LOGO2_PATH = "assets/scale_icon.png"
+LOGO_SIZE = (100, 150)
+# Resized logos, saved as PNGs that tk.PhotoImage reads without PIL.
+LOGO_CACHE_DIR = "assets/.cache"
+
+SCALE_POLL_MS = 200
+# How long a category press waits for the scale to settle before giving up.
+STABLE_WAIT_MS = 3000
+# How often the Tk thread collects finished db calls while any are running.
+DISPATCH_POLL_MS = 15
+# How often the Tk thread checks the totals model for changes.
+TOTALS_POLL_MS = 200
+
+def cached_logo(path, size):
+    """A PNG of the image at path resized to size. It is made with PIL the
+    first time and reused until the image's mtime or the size changes."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    prefix = f"{stem}-{size[0]}x{size[1]}-"
+    cached = os.path.join(LOGO_CACHE_DIR, f"{prefix}{os.stat(path).st_mtime_ns}.png")
+    if os.path.exists(cached):
+        return cached
+    from PIL import Image
+    os.makedirs(LOGO_CACHE_DIR, exist_ok=True)
+    for name in os.listdir(LOGO_CACHE_DIR):
+        if name.startswith(prefix):  # from an older version of the image
+            os.remove(os.path.join(LOGO_CACHE_DIR, name))
+    Image.open(path).resize(size, Image.LANCZOS).save(cached + ".part", "PNG")
+    os.replace(cached + ".part", cached)
+    return cached
+
+class DbDispatcher:
+    """Runs db calls on one worker thread, in the order they were
+    submitted, and hands each result to a callback on the Tk thread. The
+    results are collected with after(), because Tk must only be used
+    from its own thread.
+
+    Calls submitted with the same key coalesce. A call still queued is
+    skipped once a newer call with its key arrives, and the result of a
+    call that has been superseded is dropped. So switching sources
+    quickly runs one totals query, for the last source picked."""
+
+    def __init__(self, widget, poll_ms=DISPATCH_POLL_MS):
+        self._widget = widget
+        self._poll_ms = poll_ms
+        self._jobs = queue.SimpleQueue()
+        self._results = queue.SimpleQueue()
+        self._tickets = itertools.count()
+        self._latest = {}  # key -> ticket of the newest call with that key
+        self._outstanding = 0
+        self._polling = False
+        self._thread = threading.Thread(target=self._run, name="gui-db", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, on_done=None, on_error=None, key=None, **kwargs):
+        """Queue fn(*args, **kwargs). on_done(result) or on_error(exception)
+        is then called on the Tk thread."""
+        ticket = next(self._tickets)
+        if key is not None:
+            self._latest[key] = ticket
+        self._outstanding += 1
+        self._jobs.put((ticket, key, fn, args, kwargs, on_done, on_error))
+        if not self._polling:
+            self._polling = True
+            self._widget.after(self._poll_ms, self._poll)
+
+    def _current(self, ticket, key):
+        return key is None or self._latest.get(key) == ticket
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            ticket, key, fn, args, kwargs = job[:5]
+            if not self._current(ticket, key):
+                self._results.put((job, None, None))
+                continue
+            try:
+                self._results.put((job, fn(*args, **kwargs), None))
+            except Exception as e:
+                self._results.put((job, None, e))
+
+    def _poll(self):
+        try:
+            while True:
+                try:
+                    job, result, error = self._results.get_nowait()
+                except queue.Empty:
+                    break
+                self._outstanding -= 1
+                ticket, key, fn, _, _, on_done, on_error = job
+                if not self._current(ticket, key):
+                    continue
+                if error is None:
+                    if on_done:
+                        on_done(result)
+                elif on_error:
+                    on_error(error)
+                else:
+                    print(f"⚠️ {getattr(fn, '__name__', fn)} failed: {error}")
+        finally:
+            if self._outstanding:
+                self._widget.after(self._poll_ms, self._poll)
+            else:
+                self._polling = False
+
+    def close(self):
+        """Finish the calls already queued, so no logged entry is lost,
+        then stop the worker. Their callbacks are not run."""
+        self._jobs.put(None)
+        self._thread.join()
+
 
 class ScaleLoggerApp(tk.Tk):
     def __init__(self):
@@ -18,16 +134,76 @@ class ScaleLoggerApp(tk.Tk):
         self.geometry("800x500")
         self.resizable(False, False)
 
+        # Opened on a worker thread (finding a USB scale can be slow);
+        # until then weights are entered by hand.
+        self.scale = None
+        self.dashboard = None
+        self._last_seq = None
+        self._waiting_for_scale = False
+
+        # Every db call goes through the worker, so a lock wait or a slow
+        # disk never freezes the touchscreen.
+        self.db_worker = DbDispatcher(self)
+        self.types = []
+        # Today's totals in memory, once loaded; until then (or if it
+        # can't start) totals come from create_report on the worker.
+        self.totals = None
+        self._totals_dirty = False
+        self._queried_totals = None  # (source, {type: lb})
+        # [source, type, lb] entries shown but not saved yet.
+        self._unsaved = []
+
         self.create_widgets()
-        self.update_totals()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.bind("<Map>", self.on_first_map)
+        self.db_worker.submit(db.initialize_db, on_error=self.db_failed)
+        self.db_worker.submit(lambda: (db.get_sources(), db.get_types()),
+                              on_done=self.show_choices, on_error=self.db_failed)
+        self.db_worker.submit(totals.shared, on_done=self.attach_totals,
+                              on_error=lambda e: print(f"⚠️ Totals model unavailable, querying instead: {e}"))
+        self.open_scale()
+
+    def on_first_map(self, event):
+        if event.widget is not self:
+            return
+        self.unbind("<Map>")
+        if stats.enabled():
+            stats.record("gui.time_to_window", time.perf_counter() - _process_start)
+
+    def open_scale(self):
+        """Open the scale on a worker thread and start polling it once it
+        is ready."""
+        state = {}
+
+        def work():
+            try:
+                state["scale"] = scale.open_default_reader()
+            except Exception as e:
+                state["error"] = e
+
+        def wait():
+            if not state:
+                self.after(SCALE_POLL_MS, wait)
+            elif "error" in state:
+                print(f"⚠️ Scale unavailable, using manual entry: {state['error']}")
+                self.scale_status.config(text="Manual entry")
+            elif state["scale"] is None:
+                self.scale_status.config(text="Manual entry")
+            else:
+                self.scale = state["scale"]
+                self.scale_status.config(text="")
+                self.poll_scale()
+
+        threading.Thread(target=work, name="scale-open", daemon=True).start()
+        self.after(SCALE_POLL_MS, wait)
 
     def create_widgets(self):
         # === Top logos and input frame ===
         top_frame = ttk.Frame(self)
         top_frame.pack(pady=10)
 
-        self.logo1 = self.load_logo(LOGO1_PATH, (100, 150))
-        self.logo2 = self.load_logo(LOGO2_PATH, (100, 150))
+        self.logo1 = self.load_logo(LOGO1_PATH, LOGO_SIZE)
+        self.logo2 = self.load_logo(LOGO2_PATH, LOGO_SIZE)
 
         if self.logo1:
             logo1_label = ttk.Label(top_frame, image=self.logo1)
@@ -41,15 +217,16 @@ class ScaleLoggerApp(tk.Tk):
         ttk.Label(input_frame, text="Weight (lb):").pack(anchor='w')
         self.weight_var = tk.DoubleVar()
         ttk.Entry(input_frame, textvariable=self.weight_var, width=10).pack()
+        self.scale_status = ttk.Label(input_frame, text="Looking for scale…")
+        self.scale_status.pack(anchor='w')
 
         ttk.Label(input_frame, text="Source:").pack(anchor='w', pady=(10, 0))
         self.source_var = tk.StringVar()
-        source_list = db.get_sources()
+        # Filled in by show_choices() once the database has been read.
         self.source_dropdown = ttk.Combobox(input_frame, 
                                             textvariable=self.source_var, 
-                                            values=source_list, 
+                                            values=[], 
                                             state='readonly')
-        self.source_dropdown.current(0)
         self.source_dropdown.pack()
 
         if self.logo2:
@@ -64,15 +241,9 @@ class ScaleLoggerApp(tk.Tk):
 
         ttk.Label(self.type_frame, text="Category:", font=("Segoe UI", 12, "bold")).pack()
 
-        button_row = ttk.Frame(self.type_frame)
-        button_row.pack(pady=5)
-
+        self.button_row = ttk.Frame(self.type_frame)
+        self.button_row.pack(pady=5)
         self.category_buttons = []
-        for i, cat in enumerate(db.get_types()):
-            btn = tk.Button(button_row, text=cat, width=12, height=2,
-                            command=lambda c=cat: self.log_entry(c))
-            btn.grid(row=i//4, column=i % 4, padx=5, pady=5)
-            self.category_buttons.append(btn)
 
         # === Totals Display ===
 
@@ -82,61 +253,204 @@ class ScaleLoggerApp(tk.Tk):
             font=("Arial", 10, "italic"))
         self.current_source_label.pack(side="top", pady=2)
         self.total_label = ttk.Label(self, text="Totals will appear here.", font=("Segoe UI", 10))
-        self.total_label.pack(pady=10)
+        self.total_label.pack(pady=(10, 2))
+        self.entry_status = ttk.Label(self, text="", font=("Segoe UI", 9))
+        self.entry_status.pack()
         ttk.Button(self, 
                    text="Generate Report", 
                    command=self.open_report_popup).pack(pady=5)
         self.source_var.trace_add("write", 
                                   lambda *args: self.update_totals())
 
+    def show_choices(self, choices):
+        sources, self.types = choices
+        self.source_dropdown.config(values=sources)
+        for i, cat in enumerate(self.types):
+            btn = tk.Button(self.button_row, text=cat, width=12, height=2,
+                            command=lambda c=cat: self.log_entry(c))
+            btn.grid(row=i//4, column=i % 4, padx=5, pady=5)
+            self.category_buttons.append(btn)
+        if sources:
+            self.source_dropdown.current(0)  # the trace loads its totals
+
+    def attach_totals(self, model):
+        self.totals = model
+        model.subscribe(self._on_totals_change)
+        self.update_totals()
+        self.poll_totals()
+
+    def _on_totals_change(self, kind, data):
+        # Called on whichever thread changed the model; Tk is left to
+        # poll_totals().
+        self._totals_dirty = True
+
+    def poll_totals(self):
+        if self._totals_dirty:
+            self._totals_dirty = False
+            self.show_totals()
+        self.after(TOTALS_POLL_MS, self.poll_totals)
+
+    def db_failed(self, error):
+        self.total_label.config(text=f"Error: {error}")
+        messagebox.showerror("Database Error", str(error))
+
+    def start_dashboard(self, port):
+        """Serve the live totals page from this process, so it updates the
+        moment an entry is logged here."""
+        from scale_logger import dashboard
+
+        def started(server):
+            self.dashboard = server
+
+        self.db_worker.submit(dashboard.start, port, on_done=started,
+                              on_error=lambda e: print(f"⚠️ Dashboard not started: {e}"))
+
+    def on_close(self):
+        if self.scale:
+            self.scale.stop()
+        self.db_worker.close()
+        if self.dashboard:
+            self.dashboard.shutdown()
+            self.dashboard.server_close()
+        if self.totals:
+            self.totals.unsubscribe(self._on_totals_change)
+        totals.close_shared()
+        stats.stop_dump()
+        db.close()
+        self.destroy()
 
     def load_logo(self, path, size):
         try:
             if not os.path.exists(path):
                 print(f"⚠️ Logo not found: {path}")
                 return None
-            img = Image.open(path).resize(size, Image.LANCZOS)
-            return ImageTk.PhotoImage(img)
+            return tk.PhotoImage(file=cached_logo(path, size))
         except Exception as e:
             print(f"Error loading logo {path}: {e}")
             return None
 
-    def log_entry(self, category):
+    def scale_connected(self):
+        return self.scale is not None and self.scale.error is None
+
+    def poll_scale(self):
+        # Only the newest reading matters; anything in between is dropped.
+        reading = self.scale.latest()
+        if self.scale.error:
+            self.scale_status.config(text=f"Scale: {self.scale.error}")
+        elif reading is not None and reading.seq != self._last_seq:
+            self._last_seq = reading.seq
+            self.weight_var.set(round(reading.lb, 2))
+            self.scale_status.config(text="Stable" if reading.stable else "Settling…")
+        self.after(SCALE_POLL_MS, self.poll_scale)
+
+    @stats.instrument("gui.log_entry")
+    def log_entry(self, category, waited_ms=0):
+        reading = None
+        if self.scale_connected():
+            weight = self.scale.stable_weight()
+            if weight is None:
+                # Record only a settled reading; wait for one rather than
+                # logging whatever value happened to be on screen.
+                if waited_ms == 0 and self._waiting_for_scale:
+                    return
+                if waited_ms < STABLE_WAIT_MS:
+                    self._waiting_for_scale = True
+                    self.after(100, lambda: self.log_entry(category, waited_ms + 100))
+                    return
+                self._waiting_for_scale = False
+                messagebox.showerror("Scale Not Ready",
+                                     "The scale reading did not settle. Check the item and try again.")
+                return
+            self._waiting_for_scale = False
+            reading = self.scale.latest()
+            self.weight_var.set(round(weight, 2))
         try:
             weight = self.weight_var.get()
             source = self.source_var.get()
-            if weight <= 0:
-                messagebox.showerror("Invalid Input", "Please enter a valid weight.")
-                return
-            db.log_entry(weight=weight, dtype=category, source=source)
-            self.weight_var.set(0.0)
-            self.update_totals()
         except Exception as e:
             messagebox.showerror("Logging Error", str(e))
+            return
+        if weight <= 0:
+            messagebox.showerror("Invalid Input", "Please enter a valid weight.")
+            return
+
+        # Show the entry right away; the write runs on the worker and the
+        # entry is taken back off the screen if it fails.
+        entry = [source, category, weight]
+        self._unsaved.append(entry)
+        self.show_totals()
+        self.entry_status.config(text=f"Saving {weight:.1f} lb {category}…")
+        if not self.scale_connected():
+            self.weight_var.set(0.0)
+
+        def write():
+            db.log_entry(weight, category, source)
+            # The totals model has the entry now (db's listener updated it
+            # before log_entry returned), so stop adding it on top.
+            self._unsaved.remove(entry)
+            if reading is not None and stats.enabled():
+                stats.record("gui.scale_to_commit", time.monotonic() - reading.time)
+
+        def logged(_):
+            self.entry_status.config(text=f"✅ Logged {weight:.1f} lb {category} for {source}")
+            self.show_totals()
 
+        def failed(e):
+            self._unsaved.remove(entry)
+            self.show_totals()
+            self.entry_status.config(text=f"❌ Not saved: {weight:.1f} lb {category}")
+            if not self.scale_connected():
+                self.weight_var.set(weight)  # ready to try again
+            messagebox.showerror("Logging Error", str(e))
+
+        self.db_worker.submit(write, on_done=logged, on_error=failed)
+        if self.totals is None:
+            self.update_totals()
+
+    @stats.instrument("gui.update_totals")
     def update_totals(self):
-        try:
-            source = self.source_var.get()
-            self.current_source_label.config(
-                text=f"Current Source: {source}")
+        """Show today's totals for the selected source: straight from the
+        totals model once it is loaded, otherwise from create_report on
+        the worker (only the last of several quick calls runs)."""
+        source = self.source_var.get()
+        self.current_source_label.config(text=f"Current Source: {source}")
+        if self.totals is not None:
+            self.show_totals()
+            return
 
-            today = datetime.now().date().isoformat()
-            cat_totals, total_weight, _ = db.create_report(source, start_date=today)
+        def queried(report):
+            self._queried_totals = (source, dict(report[0]))
+            self.show_totals()
 
-            if not cat_totals:
-                self.total_label.config(text="No logs yet for today.")
-                return
+        today = datetime.now().date().isoformat()
+        self.db_worker.submit(
+            db.create_report, source, start_date=today, include_rows=False, key="totals",
+            on_done=queried, on_error=lambda e: self.total_label.config(text=f"Error: {e}"))
 
-            lines = [f"{k}: {v:.1f} lb" for k, v in cat_totals.items()]
-            lines.append(f"Total: {total_weight:.1f} lb")
-            self.total_label.config(text="\n".join(lines))
-        except Exception as e:
-            self.total_label.config(text=f"Error: {e}")
+    def show_totals(self):
+        """Render the selected source's totals, plus entries still being saved."""
+        source = self.source_var.get()
+        if self.totals is not None:
+            cat_totals = self.totals.source_totals(source)
+        elif self._queried_totals is not None and self._queried_totals[0] == source:
+            cat_totals = dict(self._queried_totals[1])
+        else:
+            return
+        for entry_source, category, weight in list(self._unsaved):
+            if entry_source == source:
+                cat_totals[category] = cat_totals.get(category, 0.0) + weight
+        if not cat_totals:
+            self.total_label.config(text="No logs yet for today.")
+            return
+        lines = [f"{k}: {v:.1f} lb" for k, v in cat_totals.items()]
+        lines.append(f"Total: {sum(cat_totals.values()):.1f} lb")
+        self.total_label.config(text="\n".join(lines))
 
     def open_report_popup(self):
+        from tkcalendar import DateEntry
         popup = tk.Toplevel(self)
         popup.title("Generate Report")
-        popup.geometry("320x260")
+        popup.geometry("320x300")
     
         today = datetime.now().date()
     
@@ -159,80 +473,110 @@ class ScaleLoggerApp(tk.Tk):
         end_cal.pack(pady=6)
     
         def generate_per_source_csvs():
+            from tkinter import filedialog
             base_dir = filedialog.askdirectory(title="Select base directory (Backups/ will be used)")
             if not base_dir:
                 return
     
             start_date = start_cal.get_date().isoformat()  # YYYY-MM-DD
             end_date   = end_cal.get_date().isoformat()
+            self.run_export(popup, start_date, end_date, os.path.join(base_dir, "Backups"))
     
-            backups_dir = os.path.join(base_dir, "Backups")
-            os.makedirs(backups_dir, exist_ok=True)
+        def show_summary():
+            self.show_summary(popup, start_cal.get_date().isoformat(), end_cal.get_date().isoformat())
+
+        ttk.Button(popup, text="Generate CSVs", command=generate_per_source_csvs).pack(pady=(18, 6))
+        ttk.Button(popup, text="Show Summary", command=show_summary).pack()
+
+    def show_summary(self, parent, start_date, end_date):
+        """Sources x types table of totals for the range, from one grouped query."""
+        self.db_worker.submit(
+            db.aggregate, ("source", "type"), start_date, end_date,
+            on_done=lambda result: self.summary_window(parent, start_date, end_date, result[1]),
+            on_error=lambda e: messagebox.showerror("Error", str(e), parent=parent))
+
+    def summary_window(self, parent, start_date, end_date, rows):
+        if not parent.winfo_exists():
+            return
+        if not rows:
+            messagebox.showinfo("No Data", f"No logs found between {start_date} and {end_date}.", parent=parent)
+            return
+        types = [t for t in self.types if any(r[1] == t for r in rows)]
+        table = {}
+        for source, dtype, weight, _ in rows:
+            table.setdefault(source, {})[dtype] = weight
+
+        window = tk.Toplevel(parent)
+        window.title(f"Summary {start_date} to {end_date}")
+        columns = ["source", *types, "Total"]
+        tree = ttk.Treeview(window, columns=columns, show="headings", height=min(len(table) + 1, 20))
+        for col in columns:
+            tree.heading(col, text=col.capitalize() if col == "source" else col)
+            tree.column(col, width=160 if col == "source" else 80, anchor="w" if col == "source" else "e")
+        for source, by_type in table.items():
+            tree.insert("", "end", values=[source, *(f"{by_type.get(t, 0.0):.1f}" for t in types),
+                                           f"{sum(by_type.values()):.1f}"])
+        type_totals = [sum(by_type.get(t, 0.0) for by_type in table.values()) for t in types]
+        tree.insert("", "end", values=["Total", *(f"{w:.1f}" for w in type_totals), f"{sum(type_totals):.1f}"])
+        tree.pack(fill="both", expand=True, padx=8, pady=8)
     
-            all_sources = db.get_sources()
-            conn = db.connect()
+    def run_export(self, parent, start_date, end_date, backups_dir):
+        """Run the CSV export on a worker thread behind a progress dialog."""
+        from scale_logger import export
+        dialog = tk.Toplevel(parent)
+        dialog.title("Exporting")
+        dialog.geometry("320x130")
+        dialog.transient(parent)
+        dialog.grab_set()
+
+        status = ttk.Label(dialog, text="Starting export…")
+        status.pack(pady=(12, 4))
+        bar = ttk.Progressbar(dialog, length=260, mode="determinate")
+        bar.pack(pady=4)
+        cancel = threading.Event()
+        ttk.Button(dialog, text="Cancel", command=cancel.set).pack(pady=6)
+
+        # Written by the worker, read by poll() on the Tk thread.
+        state = {"done": 0, "total": 0, "result": None, "error": None, "finished": False}
+
+        def progress(done, total):
+            state["done"], state["total"] = done, total
+
+        def work():
             try:
-                any_written = False
-                for source_name in all_sources:
-                    rows = conn.execute(
-                        """
-                        SELECT
-                            logs.id,
-                            logs.timestamp,
-                            logs.weight_lb,
-                            s.name AS source_name,
-                            t.name AS type_name,
-                            logs.action
-                        FROM logs
-                        JOIN sources s ON s.id = logs.source_id
-                        JOIN types   t ON t.id = logs.type_id
-                        WHERE date(logs.timestamp) BETWEEN ? AND ?
-                          AND logs.action = 'record'
-                          AND s.name = ?
-                        ORDER BY logs.timestamp ASC
-                        """,
-                        (start_date, end_date, source_name),
-                    ).fetchall()
-    
-                    if not rows:
-                        continue
-    
-                    # Totals
-                    totals = {}
-                    for (_id, _ts, wt, _sname, tname, _act) in rows:
-                        totals[tname] = totals.get(tname, 0.0) + float(wt or 0.0)
-    
-                    # Filename includes range
-                    safe_src = source_name.replace(" ", "_")
-                    filename = f"{safe_src}_{start_date}_to_{end_date}.csv"
-                    filepath = os.path.join(backups_dir, filename)
-    
-                    with open(filepath, "w", newline="", encoding="utf-8") as f:
-                        writer = csv.writer(f)
-                        writer.writerow(["Summary by Category"])
-                        writer.writerow(["type_name", "total_weight_lb"])
-                        for tname, total in totals.items():
-                            writer.writerow([tname, f"{total:.1f}"])
-    
-                        writer.writerow([])
-                        writer.writerow(["id", "timestamp", "weight_lb", "source_name", "type_name", "action"])
-                        for r in rows:
-                            writer.writerow(r)
-    
-                    any_written = True
-    
-                if any_written:
-                    messagebox.showinfo("Success", f"CSV(s) saved under:\n{backups_dir}")
-                else:
-                    messagebox.showinfo("No Data", f"No logs found between {start_date} and {end_date}.")
+                state["result"] = export.export_per_source_csvs(
+                    start_date, end_date, backups_dir, progress=progress, cancel=cancel)
             except Exception as e:
-                messagebox.showerror("Error", str(e))
+                state["error"] = e
             finally:
-                conn.close()
-    
-        ttk.Button(popup, text="Generate CSVs", command=generate_per_source_csvs).pack(pady=18)
-    
+                db.close_thread()
+                state["finished"] = True
+
+        def poll():
+            if state["total"]:
+                bar["maximum"] = state["total"]
+                bar["value"] = state["done"]
+                status.config(text=f"{state['done']:,} of {state['total']:,} entries")
+            if not state["finished"]:
+                dialog.after(100, poll)
+                return
+            dialog.destroy()
+            if isinstance(state["error"], export.ExportCancelled):
+                messagebox.showinfo("Cancelled", "Export cancelled; no files were written.", parent=parent)
+            elif state["error"] is not None:
+                messagebox.showerror("Error", str(state["error"]), parent=parent)
+            elif state["result"]:
+                messagebox.showinfo("Success", f"CSV(s) saved under:\n{backups_dir}", parent=parent)
+            else:
+                messagebox.showinfo("No Data", f"No logs found between {start_date} and {end_date}.", parent=parent)
+
+        threading.Thread(target=work, daemon=True).start()
+        poll()
+
 if __name__ == "__main__":
-    db.initialize_db()
     app = ScaleLoggerApp()
+    if stats.enabled():
+        app.after_idle(stats.start_dump)
+    if os.environ.get("FOODLOG_DASHBOARD"):
+        app.after_idle(lambda: app.start_dashboard(int(os.environ["FOODLOG_DASHBOARD"])))
     app.mainloop()
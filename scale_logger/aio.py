@@ -0,0 +1,187 @@
+"""
+aio.py – asyncio front end for scale_logger.db
+
+    from scale_logger import aio
+    await aio.log_entry(5.0, "Dry", "Safeway")
+    totals, total, rows = await aio.create_report("Safeway")
+    async for ts, weight, source, dtype, action in aio.iter_logs(source="Safeway"):
+        ...
+
+Each coroutine runs the db function of the same name on a worker thread,
+so the event loop never waits on SQLite. Reads share a pool of READERS
+threads, one per core up to four. db.connect() keeps one connection per
+thread, so every reader has its own, and sqlite3 releases the GIL while
+a query steps, so on a multi-core machine several queries run at once.
+Writes all go to one writer thread and run in the order they were
+started, which keeps undo and logging in sequence and leaves the
+database with a single writing connection.
+
+In batched durability, aggregate(), get_source_logs(), get_all_logs()
+and iter_logs() commit the queued entries before reading. The commit is
+sent to the writer thread first, so the readers never write.
+
+A read started after a write has been awaited sees that write. A read
+started while a write is still queued may or may not see it.
+
+iter_logs() and execute_range() are async iterators. Rows are fetched
+ITER_CHUNK at a time, so a long listing never holds the loop, and memory
+stays bounded however many rows there are. A db generator keeps the
+connection of the thread that started it, so every stream runs on one
+stream thread of its own, shared by all streams a chunk at a time,
+rather than on the reader pool.
+
+The threads start on first use. close() stops them; db.close() still
+closes the connections.
+"""
+
+import asyncio
+import itertools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from scale_logger import db
+
+# Readers hold the GIL while they turn rows into tuples, so threads beyond
+# the core count only make them (and the event loop) wait for each other.
+READERS = min(4, os.cpu_count() or 1)
+ITER_CHUNK = 500
+
+_executors = None
+_executors_lock = threading.Lock()
+
+
+def _pools():
+    global _executors
+    if _executors is None:
+        with _executors_lock:
+            if _executors is None:
+                _executors = (ThreadPoolExecutor(READERS, thread_name_prefix="aio-reader"),
+                              ThreadPoolExecutor(1, thread_name_prefix="aio-writer"),
+                              ThreadPoolExecutor(1, thread_name_prefix="aio-stream"))
+    return _executors
+
+
+def close():
+    """Stop the reader, writer and stream threads after the work already
+    queued."""
+    global _executors
+    with _executors_lock:
+        executors, _executors = _executors, None
+    if executors is not None:
+        for executor in executors:
+            executor.shutdown()
+
+
+def _read(fn, *args, **kwargs):
+    return asyncio.wrap_future(_pools()[0].submit(fn, *args, **kwargs))
+
+
+def _write(fn, *args, **kwargs):
+    return asyncio.wrap_future(_pools()[1].submit(fn, *args, **kwargs))
+
+
+async def _flush():
+    """Commit batched entries on the writer thread, so that a db read
+    that flushes first finds nothing left to write."""
+    if db.DURABILITY == "batched":
+        await _write(db.flush_pending)
+
+
+async def _read_flushed(fn, *args, **kwargs):
+    await _flush()
+    return await _read(fn, *args, **kwargs)
+
+
+# Writes
+
+async def initialize_db():
+    return await _write(db.initialize_db)
+
+
+async def log_entry(weight, dtype, source):
+    return await _write(db.log_entry, weight, dtype, source)
+
+
+async def log_entries(entries):
+    return await _write(db.log_entries, entries)
+
+
+async def delete_last_entry():
+    return await _write(db.delete_last_entry)
+
+
+async def undelete_last_entry():
+    return await _write(db.undelete_last_entry)
+
+
+async def add_source(name):
+    return await _write(db.add_source, name)
+
+
+async def flush_pending():
+    return await _write(db.flush_pending)
+
+
+# Reads
+
+async def create_report(source, start_date=None, end_date=None, include_rows=True):
+    return await _read(db.create_report, source, start_date, end_date, include_rows)
+
+
+async def aggregate(group_by=("source", "type"), start_date=None, end_date=None,
+                    sources=None, types=None, running_total=False):
+    return await _read_flushed(db.aggregate, group_by, start_date, end_date,
+                       sources, types, running_total)
+
+
+async def get_source_logs(source, start_date, end_date=None):
+    return await _read_flushed(db.get_source_logs, source, start_date, end_date)
+
+
+async def get_all_logs(include_deleted=False):
+    return await _read_flushed(db.get_all_logs, include_deleted)
+
+
+async def get_sources():
+    return await _read(db.get_sources)
+
+
+async def get_types():
+    return await _read(db.get_types)
+
+
+# Streams
+
+async def _stream(rows, chunk):
+    """Yield the items of the blocking iterator rows, pulling chunk at a
+    time on the stream thread."""
+    stream = _pools()[2]
+    try:
+        while True:
+            batch = await asyncio.wrap_future(
+                stream.submit(lambda: list(itertools.islice(rows, chunk))))
+            for row in batch:
+                yield row
+            if len(batch) < chunk:
+                return
+    finally:
+        # Close the generator on its own thread too; if we were cancelled
+        # mid-chunk, this runs once that chunk is done.
+        close_rows = getattr(rows, "close", None)
+        if close_rows is not None:
+            stream.submit(close_rows)
+
+
+async def iter_logs(source=None, dtype=None, since=None, until=None, action="record",
+                    page_size=db.LOG_PAGE_SIZE, chunk=ITER_CHUNK):
+    """Async iterator over db.iter_logs() with the same arguments."""
+    await _flush()
+    async for row in _stream(db.iter_logs(source, dtype, since, until, action, page_size), chunk):
+        yield row
+
+
+def execute_range(sql, params, start_date=None, end_date=None, chunk=ITER_CHUNK):
+    """Async iterator over db.execute_range(), e.g. the rows of
+    db.RANGE_LOGS_SQL for a CSV export."""
+    return _stream(db.execute_range(sql, params, start_date, end_date), chunk)
@@ -0,0 +1,145 @@
+"""
+archive.py – move closed years out of logs into per-year database files
+
+    python cli.py archive 2024
+
+archive_year(year) moves that year's log rows into foodlog-<year>.db next
+to the main database. Each archive has the same logs and daily_totals
+tables as the main database, with the same ids, plus a copy of sources
+and types so it can be read on its own. The archives table in the main
+database lists them, and db.py attaches an archive only when a read's
+date range reaches its year (see db.archive_schemas()). Reports over any
+range give the same numbers before and after archiving.
+
+A record stays in the main database if a tombstone from a later year
+cancels it, so that undo history never spans two files. Entries that
+arrive for an archived year later, e.g. through sync, are counted from
+the main database. Running archive_year() again moves them into the
+archive. Sync before archiving: export_changes() only reads logs, so rows
+archived before they were sent never reach the other stations.
+
+The move runs in two steps. First the rows are copied into the archive,
+then they are deleted from logs and the year is registered. If the run
+is interrupted between the two, the year isn't registered, so nothing is
+counted twice; running it again finishes the move.
+"""
+
+import os
+from datetime import datetime
+
+from scale_logger import db
+
+# Rows of one year [?1, ?2) that move: records not cancelled from a later
+# year, and tombstones whose record moves with them (or that cancel
+# nothing).
+MOVABLE_SQL = """
+    SELECT id FROM main.logs
+    WHERE ts_us >= ?1 AND ts_us < ?2 AND (
+        (action = 'record' AND NOT EXISTS (
+            SELECT 1 FROM main.logs d WHERE d.ref_id = logs.id AND d.ts_us >= ?2))
+        OR (action = 'delete' AND (ref_id IS NULL OR ref_id IN (
+            SELECT id FROM main.logs WHERE ts_us >= ?1 AND ts_us < ?2))))
+    """
+
+
+def archive_file(year):
+    stem = os.path.splitext(os.path.basename(db.DB_PATH))[0]
+    return f"{stem}-{year}.db"
+
+
+def _create_tables(conn, schema):
+    """Give the attached archive the main database's logs columns, the
+    indexes the report queries use, daily_totals, sources and types."""
+    columns = conn.execute("PRAGMA main.table_info(logs)").fetchall()
+    have = {row[1] for row in conn.execute(f"PRAGMA {schema}.table_info(logs)")}
+    if not have:
+        conn.execute(f"CREATE TABLE {schema}.logs (id INTEGER PRIMARY KEY, "
+                     + ", ".join(f"{c[1]} {c[2]}" for c in columns if c[1] != "id") + ")")
+    else:
+        for c in columns:
+            if c[1] not in have:  # added to the main database since
+                conn.execute(f"ALTER TABLE {schema}.logs ADD COLUMN {c[1]} {c[2]}")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_logs_us ON logs(ts_us)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_logs_source_us "
+                 "ON logs(source_id, action, ts_us)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_logs_action_us ON logs(action, ts_us)")
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {schema}.idx_logs_ref "
+                 "ON logs(ref_id) WHERE ref_id IS NOT NULL")
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS {schema}.daily_totals (
+        day TEXT NOT NULL,
+        source_id INTEGER NOT NULL,
+        type_id INTEGER NOT NULL,
+        weight REAL NOT NULL DEFAULT 0,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (source_id, day, type_id)
+    ) WITHOUT ROWID''')
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {schema}.sources "
+                 "(id INTEGER PRIMARY KEY, name TEXT NOT NULL)")
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {schema}.types "
+                 "(id INTEGER PRIMARY KEY, name TEXT NOT NULL, sort_order INTEGER)")
+    return [c[1] for c in columns]
+
+
+def archives():
+    """[(year, path, rows, archived_at)] for every archived year, oldest first."""
+    return [(year, db.archive_path(file), rows, at) for year, file, rows, at in db.connect().execute(
+        "SELECT year, file, rows, archived_at FROM archives ORDER BY year")]
+
+
+def archive_year(year, vacuum=True):
+    """Move the rows of a closed year into its archive file. Returns the
+    number of rows moved. vacuum=True then compacts the main database so
+    the file actually shrinks."""
+    year = int(year)
+    if year >= datetime.now().year:
+        raise ValueError(f"{year} is not over yet; only past years can be archived")
+    db.flush_pending()
+    conn = db.connect()
+    file = archive_file(year)
+    path = db.archive_path(file)
+    if year in db._lookup()["archives"] and not os.path.exists(path):
+        raise FileNotFoundError(f"Archive for {year} is missing: {path}")
+
+    schema = f"archive_{year}"
+    for (name,) in conn.execute("SELECT name FROM pragma_database_list WHERE name LIKE 'archive%'").fetchall():
+        conn.execute(f"DETACH DATABASE {name}")
+    conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+    bounds = db.day_range_us(f"{year}-01-01", f"{year}-12-31")
+
+    # Step 1: copy into the archive and recompute its rollup.
+    columns = ", ".join(_create_tables(conn, schema))
+    with conn:
+        conn.execute(f"INSERT OR IGNORE INTO {schema}.logs ({columns}) "
+                     f"SELECT {columns} FROM main.logs WHERE id IN ({MOVABLE_SQL})", bounds)
+        conn.execute(f"DELETE FROM {schema}.daily_totals")
+        conn.execute(f"INSERT INTO {schema}.daily_totals (day, source_id, type_id, weight, count) "
+                     + db.in_schema(db._ROLLUP_FROM_LOGS_SQL, schema))
+        conn.execute(f"INSERT OR REPLACE INTO {schema}.sources SELECT id, name FROM main.sources")
+        conn.execute(f"INSERT OR REPLACE INTO {schema}.types SELECT id, name, sort_order FROM main.types")
+
+    # Step 2: drop the copied rows from logs (the rollup triggers take them
+    # out of daily_totals) and register the archive.
+    sync_removed = conn.execute(
+        "SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = 'sync_removed'").fetchone()
+    with conn:
+        if sync_removed:
+            last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM sync_removed").fetchone()[0]
+        moved = conn.execute(
+            f"DELETE FROM main.logs WHERE id IN (SELECT id FROM {schema}.logs)").rowcount
+        if sync_removed:
+            # Archiving isn't an undo; other stations keep their copies.
+            conn.execute("DELETE FROM sync_removed WHERE seq > ?", (last_seq,))
+        left = conn.execute("SELECT COUNT(*) FROM main.daily_totals WHERE day BETWEEN ? AND ?",
+                            (f"{year}-01-01", f"{year}-12-31")).fetchone()[0]
+        if left:
+            raise RuntimeError(f"{left} daily_totals rows for {year} would stay behind; nothing moved")
+        rows = conn.execute(f"SELECT COUNT(*) FROM {schema}.logs").fetchone()[0]
+        conn.execute(
+            "INSERT INTO archives (year, file, rows, archived_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(year) DO UPDATE SET rows = excluded.rows, archived_at = excluded.archived_at",
+            (year, file, rows, datetime.now().isoformat(timespec="seconds")))
+    db._bump()
+    db._lookup(reload=True)
+    if vacuum and moved:
+        conn.execute("VACUUM main")
+    return moved
@@ -0,0 +1,378 @@
+"""
+bench.py – storage-layer benchmarks on synthetic pantry data
+
+    python -m scale_logger.bench --days 365 --per-day 60 --out bench.json
+
+Generates a database of sources x types x days x weigh-ins per day
+(weights and times drawn from a seeded RNG, so runs are comparable), then
+times the public db functions against it and writes the results as JSON.
+Compare two runs with any JSON diff, or load them into a notebook.
+
+The database is built in a temporary directory unless --db is given; with
+--db and an existing file, generation is skipped so large datasets can be
+reused between runs. The write benchmarks add rows, so a reused database
+grows slightly with every run.
+
+The concurrent.* results run the same batch of uncached reports (every
+source, month by month over the last year) once through the blocking db
+API and once through scale_logger.aio with asyncio.gather. Each is reported
+in reports per second, along with the longest time the event loop could
+not run anything else (max_stall_ms) while the batch ran inside it.
+
+The create_report.* and aggregate.* cases empty the report cache before
+every call, so they time the queries themselves; the *.cached cases time
+the memoized path.
+
+The startup.* results time whole `python cli.py ...` processes against the
+same database, next to a bare `python -c pass` for reference, since the
+CLI is meant to be cheap enough to call from scripts in a loop.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from scale_logger import db, export
+
+GENERATE_CHUNK = 100_000
+CLI_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cli.py")
+
+
+def synthetic_entries(sources, types, days, per_day, end_day=None, seed=0):
+    """Yield (timestamp, weight_lb, source_name, type_name) tuples in time
+    order: per_day weigh-ins a day between 9:00 and 17:00, with a few
+    sources and types much busier than the rest, as at a real pantry."""
+    rng = random.Random(seed)
+    end_day = end_day or date.today()
+    source_weights = [1.0 / (i + 1) for i in range(len(sources))]
+    type_weights = [1.0 / (i + 1) for i in range(len(types))]
+    for d in range(days - 1, -1, -1):
+        day = datetime.combine(end_day - timedelta(days=d), datetime.min.time())
+        offsets = sorted(rng.randrange(9 * 3600 * 10**6, 17 * 3600 * 10**6) for _ in range(per_day))
+        for us in offsets:
+            yield ((day + timedelta(microseconds=us)).isoformat(),
+                   round(rng.lognormvariate(2.0, 0.8), 2),
+                   rng.choices(sources, source_weights)[0],
+                   rng.choices(types, type_weights)[0])
+
+
+def generate(n_sources, days, per_day, seed=0):
+    """Fill the database at db.DB_PATH. Returns the number of rows."""
+    db.initialize_db()
+    sources = db.get_sources()
+    for i in range(len(sources), n_sources):
+        db.add_source(f"Bench Source {i:03d}")
+    sources = db.get_sources()[:n_sources]
+    types = db.get_types()
+    ids = {("s", n): db.get_id_by_name("sources", n) for n in sources}
+    ids.update({("t", n): db.get_id_by_name("types", n) for n in types})
+
+    conn = db.connect()
+    chunk, total = [], 0
+    for ts, weight, source, dtype in synthetic_entries(sources, types, days, per_day, seed=seed):
+        chunk.append((ts, weight, ids["s", source], ids["t", dtype]))
+        if len(chunk) >= GENERATE_CHUNK:
+            with conn:
+                conn.executemany(db.INSERT_RECORD_SQL, chunk)
+            total += len(chunk)
+            chunk = []
+    with conn:
+        conn.executemany(db.INSERT_RECORD_SQL, chunk)
+    return total + len(chunk)
+
+
+def _rows(result):
+    if isinstance(result, tuple) and len(result) == 3:  # create_report
+        return len(result[2]) or len(result[0])
+    if isinstance(result, tuple) and len(result) == 2 and isinstance(result[1], list):  # aggregate
+        return len(result[1])
+    if isinstance(result, (list, dict)):
+        return len(result)
+    if isinstance(result, int):
+        return result
+    return None
+
+
+def timeit(fn, repeat):
+    """Call fn repeat times; return latency stats in milliseconds."""
+    times, rows = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - start) * 1000)
+        rows = _rows(result)
+    times.sort()
+    return {
+        "calls": repeat,
+        "total_ms": round(sum(times), 3),
+        "mean_ms": round(statistics.fmean(times), 3),
+        "p50_ms": round(times[len(times) // 2], 3),
+        "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))], 3),
+        "max_ms": round(times[-1], 3),
+        "rows": rows,
+    }
+
+
+def uncached(fn):
+    """fn with the report cache emptied before each call, so repeated
+    calls measure the query rather than a cache hit."""
+    def call():
+        db.clear_report_cache()
+        return fn()
+    return call
+
+
+def run_benchmarks(repeat, tmpdir):
+    """Time each public db function against the current database."""
+    today = date.today()
+    month_ago = (today - timedelta(days=30)).isoformat()
+    year_ago = (today - timedelta(days=365)).isoformat()
+    source = db.get_sources()[0]
+    dtype = db.get_types()[0]
+    out_dir = os.path.join(tmpdir, "export")
+
+    cases = {
+        "initialize_db": db.initialize_db,
+        "log_entry": lambda: db.log_entry(5.0, dtype, source),
+        "log_entries.1000": lambda: db.log_entries([(5.0, dtype, source)] * 1000)[0],
+        "delete_last_entry": db.delete_last_entry,
+        "undelete_last_entry": db.undelete_last_entry,
+        "create_report.today": uncached(lambda: db.create_report(source, include_rows=False)),
+        "create_report.month": uncached(
+            lambda: db.create_report(source, month_ago, today.isoformat(), include_rows=False)),
+        "create_report.year": uncached(
+            lambda: db.create_report(source, year_ago, today.isoformat(), include_rows=False)),
+        "create_report.month_rows": uncached(lambda: db.create_report(source, month_ago, today.isoformat())),
+        "aggregate.source_type.year": uncached(
+            lambda: db.aggregate(("source", "type"), year_ago, today.isoformat())),
+        "aggregate.source_month.running": uncached(
+            lambda: db.aggregate(("source", "month"), year_ago, today.isoformat(), running_total=True)),
+        "aggregate.week_type.source": uncached(
+            lambda: db.aggregate(("week", "type"), year_ago, today.isoformat(), sources=[source])),
+        "create_report.today.cached": lambda: db.create_report(source, include_rows=False),
+        "create_report.month_rows.cached": lambda: db.create_report(source, month_ago, today.isoformat()),
+        "iter_logs.first_page": lambda: len(list(zip(range(db.LOG_PAGE_SIZE), db.iter_logs()))),
+        "iter_logs.source_month": lambda: sum(1 for _ in db.iter_logs(source=source, since=month_ago)),
+        "get_sources": db.get_sources,
+        "get_types": db.get_types,
+        "export.month": lambda: sum(v[1] for v in export.export_per_source_csvs(
+            month_ago, today.isoformat(), out_dir).values()),
+    }
+    slow_cases = {
+        "get_all_logs": db.get_all_logs,
+        "verify_daily_totals": db.verify_daily_totals,
+        "rebuild_daily_totals": db.rebuild_daily_totals,
+    }
+    results = {name: timeit(fn, repeat) for name, fn in cases.items()}
+    results.update({name: timeit(fn, 1) for name, fn in slow_cases.items()})
+    return results
+
+
+def totals_benchmarks(repeat):
+    """The totals model's seeding query and its in-memory reads, next to
+    the create_report call the GUI used to make for the same numbers."""
+    from scale_logger import totals
+    source = db.get_sources()[0]
+    dtype = db.get_types()[0]
+
+    def seed():
+        totals.TotalsModel().start().close()
+
+    model = totals.TotalsModel().start()
+    try:
+        return {
+            "totals.seed": timeit(seed, repeat),
+            "totals.source_totals": timeit(lambda: model.source_totals(source), repeat),
+            "totals.log_entry": timeit(lambda: db.log_entry(5.0, dtype, source), repeat),
+            "totals.create_report.uncached": timeit(
+                uncached(lambda: db.create_report(source, include_rows=False)), repeat),
+        }
+    finally:
+        model.close()
+
+
+def _report_batch():
+    """(source, start, end) for every source and each of the last twelve
+    30-day windows."""
+    today = date.today()
+    windows = [((today - timedelta(days=30 * (i + 1))).isoformat(),
+                (today - timedelta(days=30 * i + 1)).isoformat()) for i in range(12)]
+    return [(source, start, end) for source in db.get_sources() for start, end in windows]
+
+
+def concurrency_benchmarks(repeat):
+    """Throughput of a batch of reports, sequentially through db and
+    concurrently through aio. The report cache is cleared before every
+    run so each call reaches SQLite."""
+    from scale_logger import aio
+    batch = _report_batch()
+
+    stalls = {}
+
+    async def watch(name, work):
+        # Wake every millisecond; any lateness is time the loop was blocked.
+        done = asyncio.Event()
+
+        async def tick():
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(0.001)
+                late = (time.perf_counter() - start) * 1000 - 1
+                stalls[name] = max(stalls.get(name, 0.0), late)
+
+        ticker = asyncio.ensure_future(tick())
+        await asyncio.sleep(0)
+        db.clear_report_cache()
+        try:
+            await work()
+        finally:
+            done.set()
+            await ticker
+
+    async def sync_batch():
+        for args in batch:
+            db.create_report(*args)
+
+    async def aio_batch():
+        await asyncio.gather(*(aio.create_report(*args) for args in batch))
+
+    names = {"concurrent.sync": sync_batch,
+             f"concurrent.aio.{aio.READERS}_readers": aio_batch}
+    loop = asyncio.new_event_loop()
+    try:
+        results = {name: timeit(lambda: loop.run_until_complete(watch(name, work)), repeat)
+                   for name, work in names.items()}
+    finally:
+        loop.close()
+        aio.close()
+    for name, stat in results.items():
+        stat["rows"] = len(batch)
+        stat["reports_per_s"] = round(len(batch) / stat["p50_ms"] * 1000, 1)
+        stat["max_stall_ms"] = round(stalls[name], 3)
+    return results
+
+
+def startup_benchmarks(repeat):
+    """Time fresh interpreter runs of the CLI against the current database
+    (via FOODLOG_DB), plus a bare interpreter as the floor."""
+    env = dict(os.environ, FOODLOG_DB=os.path.abspath(db.DB_PATH))
+    source = db.get_sources()[0]
+    dtype = db.get_types()[0]
+    commands = {
+        "python": ["-c", "pass"],
+        "cli.list-sources": [CLI_PATH, "list-sources"],
+        "cli.report": [CLI_PATH, "report", "--source", source],
+        "cli.log": [CLI_PATH, "log", "--weight", "5", "--type", dtype, "--source", source],
+    }
+    return {
+        f"startup.{name}": timeit(lambda args=args: subprocess.run(
+            [sys.executable, *args], env=env, stdout=subprocess.DEVNULL, check=True), repeat)
+        for name, args in commands.items()
+    }
+
+
+def daemon_benchmarks(repeat, tmpdir):
+    """Round trips to a daemon serving the current database from a thread
+    of this process, and the CLI's --daemon mode against it."""
+    from scale_logger import daemon
+    path = os.path.join(tmpdir, "bench.sock")
+    server = daemon.Daemon(path, open_scale=False)
+    threading.Thread(target=server.serve_forever, name="bench-daemon", daemon=True).start()
+    source = db.get_sources()[0]
+    dtype = db.get_types()[0]
+    try:
+        with daemon.Client(path) as client:
+            results = {
+                "daemon.ping": timeit(client.ping, repeat),
+                "daemon.log_entry": timeit(lambda: client.log_entry(5.0, dtype, source), repeat),
+                "daemon.create_report.today": timeit(
+                    lambda: client.create_report(source, include_rows=False), repeat),
+            }
+        env = dict(os.environ, FOODLOG_SOCKET=path)
+        args = [sys.executable, CLI_PATH, "--daemon", "log", "--weight", "5", "--type", dtype, "--source", source]
+        results["startup.cli.log.daemon"] = timeit(lambda: subprocess.run(
+            args, env=env, stdout=subprocess.DEVNULL, check=True), repeat)
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def _db_bytes():
+    wal = db.DB_PATH + "-wal"
+    return os.path.getsize(db.DB_PATH) + (os.path.getsize(wal) if os.path.exists(wal) else 0)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark scale_logger.db")
+    parser.add_argument("--sources", type=int, default=7)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--per-day", type=int, default=60, help="Weigh-ins per day")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=20, help="Calls per timed function")
+    parser.add_argument("--db", help="Database file to build or reuse (default: temporary)")
+    parser.add_argument("--out", help="Write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    tmpdir = tempfile.mkdtemp(prefix="foodlog-bench-")
+    try:
+        db.close()
+        db.DB_PATH = args.db or os.path.join(tmpdir, "bench.db")
+        generated, gen_seconds = 0, 0.0
+        if not os.path.exists(db.DB_PATH):
+            start = time.perf_counter()
+            generated = generate(args.sources, args.days, args.per_day, args.seed)
+            gen_seconds = time.perf_counter() - start
+        db.initialize_db()
+        row_count = db.connect().execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+
+        report = {
+            "commit": _git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "params": vars(args),
+            "dataset": {"rows": row_count, "generated": generated,
+                        "generate_s": round(gen_seconds, 3),
+                        "db_bytes": _db_bytes()},
+            "results": run_benchmarks(args.repeat, tmpdir),
+        }
+        report["results"].update(totals_benchmarks(args.repeat))
+        report["results"].update(concurrency_benchmarks(args.repeat))
+        report["results"].update(startup_benchmarks(args.repeat))
+        if hasattr(socket, "AF_UNIX"):
+            report["results"].update(daemon_benchmarks(args.repeat, tmpdir))
+        text = json.dumps(report, indent=2)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+    finally:
+        db.close()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+"""
+daemon.py – headless logging daemon behind a Unix domain socket
+
+    python cli.py daemon                 # or: python -m scale_logger.daemon
+    python cli.py --daemon log --weight 5 --type Dry --source Safeway
+
+One long-running process owns the database and the scale. Every db call
+it makes runs on a single writer thread, so the station has exactly one
+connection writing to foodlog.db. The GUI, cron jobs and scripts talk to
+the daemon instead of opening the database themselves. CSV exports only
+read, so they run on a second thread and don't hold up logging.
+
+The protocol is framed JSON. Each message is a 4-byte big-endian length
+followed by that many bytes of UTF-8 JSON:
+
+    request:  {"op": "create_report", "args": ["Safeway"], "kwargs": {}}
+    reply:    {"ok": true, "result": [{"Dry": 12.5}, 12.5, []]}
+              {"ok": false, "type": "ValueError", "error": "Unknown source: 'X'"}
+
+A connection can carry any number of requests, answered in order. The
+ops are the db functions of the same name plus "ping", "weight" (the
+scale's latest reading) and "export_per_source_csvs". log_entry with
+weight None logs the scale's stable weight. "totals" returns today's
+table from the daemon's TotalsModel (scale_logger/totals.py) without a
+query. "subscribe" turns the connection into a stream: the reply is
+that table, then one {"event": "cell", "data": [source, type, weight,
+count]} frame per change, or "snapshot" when a new day starts, until the
+client hangs up. Idle streams get a "ping" frame every HEARTBEAT_S. Client wraps all of this so that
+client.log_entry(5.0, "Dry", "Safeway") reads like the db call.
+"""
+
+import functools
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+
+from scale_logger import stats
+# db (and with it sqlite3), concurrent.futures, signal and threading are
+# only needed by the server, and the client is meant to start fast; they
+# are imported where used.
+
+SOCKET_PATH = os.environ.get("FOODLOG_SOCKET", "scale_logger/foodlog.sock")
+MAX_FRAME = 16 * 1024 * 1024
+
+_HEADER = struct.Struct(">I")
+
+OPS = ("ping", "weight", "log_entry", "delete_last_entry", "undelete_last_entry",
+       "create_report", "aggregate", "get_sources", "get_types",
+       "export_per_source_csvs", "totals")
+# Changes a subscriber may fall behind by before it is disconnected.
+SUBSCRIBER_BACKLOG = 1024
+# Idle subscribers get a ping this often, so ones that hung up are noticed.
+HEARTBEAT_S = 30
+
+
+class DaemonError(Exception):
+    """An op failed inside the daemon. kind is the exception's class name
+    there, e.g. "ValueError"."""
+
+    def __init__(self, kind, message):
+        super().__init__(f"{kind}: {message}")
+        self.kind = kind
+
+
+def send_frame(sock, obj):
+    data = json.dumps(obj, separators=(",", ":")).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exactly(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            if buf:
+                raise ConnectionError("Connection closed mid-frame")
+            return None
+        buf += chunk
+    return bytes(buf)
+
+
+def recv_frame(sock):
+    """The next message on sock, or None once the peer has closed it."""
+    header = _recv_exactly(sock, _HEADER.size)
+    if header is None:
+        return None
+    (length,) = _HEADER.unpack(header)
+    if length > MAX_FRAME:
+        raise ValueError(f"Frame of {length} bytes exceeds MAX_FRAME")
+    data = _recv_exactly(sock, length) if length else b""
+    if data is None:
+        raise ConnectionError("Connection closed mid-frame")
+    return json.loads(data)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                request = recv_frame(self.request)
+            except (OSError, ValueError):
+                return
+            if request is None:
+                return
+            if request.get("op") == "subscribe":
+                self.stream_totals()
+                return
+            try:
+                send_frame(self.request, self.server.dispatch(request))
+            except OSError:
+                return
+
+    def stream_totals(self):
+        model = self.server.totals
+        changes = queue.Queue(SUBSCRIBER_BACKLOG)
+
+        def push(kind, data):
+            try:
+                changes.put_nowait({"event": kind, "data": data})
+            except queue.Full:
+                model.unsubscribe(push)
+                try:
+                    changes.get_nowait()
+                except queue.Empty:
+                    pass
+                changes.put_nowait(None)  # too far behind: hang up
+
+        snapshot = model.subscribe(push)
+        try:
+            send_frame(self.request, {"ok": True, "result": snapshot})
+            while True:
+                try:
+                    change = changes.get(timeout=HEARTBEAT_S)
+                except queue.Empty:
+                    change = {"event": "ping", "data": None}
+                if change is None:
+                    return
+                send_frame(self.request, change)
+        except OSError:
+            pass
+        finally:
+            model.unsubscribe(push)
+
+
+# Windows builds of Python have no AF_UNIX; Daemon() then refuses to start.
+_UnixStreamServer = getattr(socketserver, "UnixStreamServer", socketserver.BaseServer)
+
+
+class Daemon(socketserver.ThreadingMixIn, _UnixStreamServer):
+    """Socket server answering OPS. Each client connection gets a thread
+    that only parses frames; the db work itself is queued to the writer
+    thread (exports to the export thread)."""
+
+    daemon_threads = True
+
+    def __init__(self, path=SOCKET_PATH, open_scale=True):
+        if not hasattr(socket, "AF_UNIX"):
+            raise OSError("The daemon needs Unix domain sockets, which this platform lacks")
+        from concurrent.futures import ThreadPoolExecutor
+        from scale_logger import db
+        _remove_stale_socket(path)
+        self.path = path
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix="daemon-writer")
+        self._exporter = ThreadPoolExecutor(1, thread_name_prefix="daemon-export")
+        self._writer.submit(db.initialize_db).result()
+        from scale_logger import totals
+        self.totals = totals.shared()
+        self.scale = None
+        if open_scale:
+            from scale_logger import scale
+            try:
+                self.scale = scale.open_default_reader()
+            except Exception as e:
+                print(f"⚠️ Scale unavailable, only explicit weights can be logged: {e}")
+        self._ops = {
+            "ping": lambda: "pong",
+            "weight": self._weight,
+            "log_entry": self._log_entry,
+            "delete_last_entry": db.delete_last_entry,
+            "undelete_last_entry": db.undelete_last_entry,
+            "create_report": db.create_report,
+            "aggregate": db.aggregate,
+            "get_sources": db.get_sources,
+            "get_types": db.get_types,
+            "export_per_source_csvs": self._export,
+            "totals": self.totals.snapshot,
+        }
+        super().__init__(path, _Handler)
+        os.chmod(path, 0o600)
+
+    def dispatch(self, request):
+        op = request.get("op")
+        fn = self._ops.get(op)
+        if fn is None:
+            return {"ok": False, "type": "ValueError", "error": f"Unknown op: {op!r}"}
+        if op == "totals":
+            return {"ok": True, "result": fn()}  # in memory; no need to queue
+        pool = self._exporter if op == "export_per_source_csvs" else self._writer
+        try:
+            with stats.timed(f"daemon.{op}"):
+                result = pool.submit(fn, *request.get("args", ()), **request.get("kwargs", {})).result()
+        except Exception as e:
+            return {"ok": False, "type": type(e).__name__, "error": str(e)}
+        return {"ok": True, "result": result}
+
+    def _weight(self):
+        if self.scale is None:
+            return None
+        reading = self.scale.latest()
+        return None if reading is None else reading._asdict()
+
+    def _log_entry(self, weight, dtype, source):
+        from scale_logger import db
+        if weight is None:
+            weight = self.scale.stable_weight() if self.scale is not None else None
+            if weight is None:
+                raise ValueError("No stable scale reading to log")
+        db.log_entry(weight, dtype, source)
+        return weight
+
+    def _export(self, start_date, end_date, out_dir):
+        from scale_logger import export
+        return export.export_per_source_csvs(start_date, end_date, out_dir)
+
+    def server_close(self):
+        super().server_close()
+        if self.scale is not None:
+            self.scale.stop()
+        self._exporter.shutdown()
+        self._writer.shutdown()
+        from scale_logger import db, totals
+        totals.close_shared()
+        db.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _remove_stale_socket(path):
+    """Remove a socket file left by a daemon that died; refuse to start
+    next to one that is still answering."""
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.unlink(path)
+    else:
+        raise OSError(f"A daemon is already listening on {path}")
+    finally:
+        probe.close()
+
+
+def run(path=SOCKET_PATH, open_scale=True, dashboard_port=None):
+    """Serve until SIGTERM or Ctrl-C. With dashboard_port, also serve the
+    live dashboard, which then sees every write as it commits."""
+    import signal
+    import threading
+    server = Daemon(path, open_scale)
+    dash = None
+    if dashboard_port:
+        from scale_logger import dashboard
+        dash = dashboard.start(dashboard_port)
+        print(f"📺 Dashboard on http://{dashboard.HOST}:{dash.server_port}/")
+    signal.signal(signal.SIGTERM,
+                  lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    print(f"🛰️ Listening on {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if dash is not None:
+            dash.shutdown()
+            dash.server_close()
+        server.server_close()
+
+
+class Client:
+    """A connection to the daemon. Each op is a method taking the same
+    arguments as the db function, e.g. client.create_report("Safeway");
+    results come back as JSON values (tuples become lists). Failures
+    raise DaemonError."""
+
+    def __init__(self, path=SOCKET_PATH, timeout=None):
+        self.path = path
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        try:
+            self._sock.connect(path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            self._sock.close()
+            raise ConnectionError(f"No daemon listening on {path}; start one with `python cli.py daemon`")
+
+    def call(self, op, *args, **kwargs):
+        send_frame(self._sock, {"op": op, "args": args, "kwargs": kwargs})
+        reply = recv_frame(self._sock)
+        if reply is None:
+            raise ConnectionError("The daemon closed the connection")
+        if not reply["ok"]:
+            raise DaemonError(reply["type"], reply["error"])
+        return reply["result"]
+
+    def subscribe(self):
+        """Yield today's table, then ("cell" | "snapshot", data) for each
+        change, until the connection is closed. The connection carries
+        nothing else afterwards."""
+        send_frame(self._sock, {"op": "subscribe"})
+        reply = recv_frame(self._sock)
+        if reply is None:
+            raise ConnectionError("The daemon closed the connection")
+        yield "snapshot", reply["result"]
+        while True:
+            change = recv_frame(self._sock)
+            if change is None:
+                return
+            if change["event"] != "ping":
+                yield change["event"], change["data"]
+
+    def __getattr__(self, op):
+        if op not in OPS:
+            raise AttributeError(op)
+        return functools.partial(self.call, op)
+
+    def close(self):
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,246 @@
+"""
+dashboard.py – today's totals on a second screen, updated live
+
+    python cli.py dashboard               # then open http://127.0.0.1:8765/
+
+Serves one page showing a table of today's pounds per source and
+category. The page stays current through server-sent events (SSE). It
+uses only the standard library and binds to localhost.
+
+    /          the page
+    /events    SSE stream: one "snapshot" event with the whole table,
+               then a "cell" event each time a source/category total changes
+    /totals    the current table as JSON
+
+Updates come from the process's TotalsModel (scale_logger/totals.py),
+never from per-viewer queries. Each viewer subscribes to the model,
+gets the current table, and then every changed cell as it happens:
+- logs, deletes and undos made in this process arrive at once;
+- writes by other processes show up within totals.POLL_S, when the
+  model sees PRAGMA data_version move.
+
+For instant updates, run the dashboard inside the process that logs:
+`cli.py daemon --dashboard`, or the GUI with FOODLOG_DASHBOARD=8765.
+
+Each viewer gets a thread and a short queue. A viewer that falls
+VIEWER_BACKLOG events behind is disconnected; EventSource reconnects and
+starts again from a fresh snapshot.
+"""
+
+import json
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from scale_logger import totals
+
+HOST = "127.0.0.1"
+PORT = 8765
+HEARTBEAT_S = 15
+VIEWER_BACKLOG = 256
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode("utf-8")
+
+
+class _Viewer:
+    """One connected page: the SSE messages waiting to be sent to it.
+    None in the queue means: disconnect."""
+
+    def __init__(self):
+        self.queue = queue.Queue(VIEWER_BACKLOG)
+        self.closed = False
+
+    def push(self, kind, data):
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(_sse(kind, data))
+        except queue.Full:
+            self.hang_up()
+
+    def hang_up(self):
+        self.closed = True
+        try:
+            self.queue.get_nowait()  # make room for the sentinel
+        except queue.Empty:
+            pass
+        self.queue.put_nowait(None)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/":
+            self._send(200, "text/html; charset=utf-8", PAGE.encode("utf-8"))
+        elif path == "/totals":
+            self._send(200, "application/json", json.dumps(self.server.model.snapshot()).encode("utf-8"))
+        elif path == "/events":
+            self._stream()
+        else:
+            self._send(404, "text/plain", b"Not found")
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self):
+        viewer = _Viewer()
+        model = self.server.model
+        snapshot = model.subscribe(viewer.push)
+        self.server.add_viewer(viewer)
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            message = _sse("snapshot", snapshot)
+            while message is not None:
+                self.wfile.write(message)
+                self.wfile.flush()
+                try:
+                    message = viewer.queue.get(timeout=HEARTBEAT_S)
+                except queue.Empty:
+                    message = b": ping\n\n"  # notices viewers that went away
+        except OSError:
+            pass
+        finally:
+            model.unsubscribe(viewer.push)
+            self.server.remove_viewer(viewer)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Dashboard(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 64  # a room full of screens reconnecting at once
+
+    def __init__(self, port=PORT, host=HOST, model=None):
+        super().__init__((host, port), _Handler)
+        self.model = model or totals.shared()
+        self._viewers = set()
+        self._viewers_lock = threading.Lock()
+
+    def add_viewer(self, viewer):
+        with self._viewers_lock:
+            self._viewers.add(viewer)
+
+    def remove_viewer(self, viewer):
+        with self._viewers_lock:
+            self._viewers.discard(viewer)
+
+    def viewer_count(self):
+        with self._viewers_lock:
+            return len(self._viewers)
+
+    def server_close(self):
+        super().server_close()
+        with self._viewers_lock:
+            for viewer in self._viewers:
+                self.model.unsubscribe(viewer.push)
+                viewer.hang_up()
+            self._viewers.clear()
+
+
+def start(port=PORT, host=HOST):
+    """Serve on a background thread, next to a GUI or daemon. Stop it
+    with shutdown() and then server_close()."""
+    server = Dashboard(port, host)
+    threading.Thread(target=server.serve_forever, name="dashboard", daemon=True).start()
+    return server
+
+
+def run(port=PORT, host=HOST):
+    """Serve until Ctrl-C."""
+    from scale_logger import db
+    db.initialize_db()
+    server = Dashboard(port, host)
+    print(f"📺 Dashboard on http://{host}:{server.server_port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>Food Logger – Today</title>
+<style>
+  body { font-family: "Segoe UI", sans-serif; margin: 2em; background: #fafafa; }
+  h1 { font-size: 1.6em; margin-bottom: 0.2em; }
+  #status { color: #888; margin-bottom: 1em; }
+  table { border-collapse: collapse; font-size: 1.3em; }
+  th, td { padding: 0.35em 0.8em; border-bottom: 1px solid #ddd; text-align: right; }
+  th:first-child, td:first-child { text-align: left; }
+  tr.total td { font-weight: bold; border-top: 2px solid #444; }
+  td.changed { background: #fff3b0; transition: background 2s; }
+</style>
+</head>
+<body>
+<h1>Today's donations <span id="day"></span></h1>
+<div id="status">Connecting…</div>
+<table id="totals"></table>
+<script>
+let state = {day: "", sources: [], types: [], cells: new Map()};
+let changed = null;
+const esc = s => s.replace(/[&<>"]/g, c => ({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;"})[c]);
+
+function render() {
+  const sources = [...state.sources], types = [...state.types];
+  for (const key of state.cells.keys()) {
+    const [s, t] = JSON.parse(key);
+    if (!sources.includes(s)) sources.push(s);
+    if (!types.includes(t)) types.push(t);
+  }
+  const weight = (s, t) => (state.cells.get(JSON.stringify([s, t])) || [0])[0];
+  const rows = sources.filter(s => types.some(t => weight(s, t)));
+  const cols = types.filter(t => sources.some(s => weight(s, t)));
+  const fmt = w => w ? w.toFixed(1) : "";
+  let html = "<tr><th>Source</th>" + cols.map(t => `<th>${esc(t)}</th>`).join("") + "<th>Total</th></tr>";
+  for (const s of rows) {
+    html += `<tr><td>${esc(s)}</td>` + cols.map(t =>
+      `<td${changed === JSON.stringify([s, t]) ? ' class="changed"' : ""}>${fmt(weight(s, t))}</td>`).join("") +
+      `<td>${fmt(cols.reduce((sum, t) => sum + weight(s, t), 0))}</td></tr>`;
+  }
+  const grand = rows.reduce((sum, s) => sum + cols.reduce((x, t) => x + weight(s, t), 0), 0);
+  html += `<tr class="total"><td>Total</td>` +
+    cols.map(t => `<td>${fmt(rows.reduce((sum, s) => sum + weight(s, t), 0))}</td>`).join("") +
+    `<td>${grand.toFixed(1)} lb</td></tr>`;
+  document.getElementById("totals").innerHTML = rows.length ? html : "<tr><td>No logs yet for today.</td></tr>";
+  document.getElementById("day").textContent = state.day;
+}
+
+const events = new EventSource("events");
+events.addEventListener("snapshot", e => {
+  const snap = JSON.parse(e.data);
+  state = {day: snap.day, sources: snap.sources, types: snap.types, cells: new Map()};
+  for (const [s, t, w, c] of snap.cells) state.cells.set(JSON.stringify([s, t]), [w, c]);
+  changed = null;
+  render();
+});
+events.addEventListener("cell", e => {
+  const [s, t, w, c] = JSON.parse(e.data);
+  const key = JSON.stringify([s, t]);
+  if (c > 0) state.cells.set(key, [w, c]); else state.cells.delete(key);
+  changed = key;
+  render();
+});
+events.onopen = () => { document.getElementById("status").textContent = "Live"; };
+events.onerror = () => { document.getElementById("status").textContent = "Reconnecting…"; };
+</script>
+</body>
+</html>
+"""
+
+
+if __name__ == "__main__":
+    run()
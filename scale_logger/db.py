@@ -1,156 +1,1179 @@
-
+import atexit
+import functools
+import os
+import re
 import sqlite3
-from datetime import datetime
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from scale_logger.stats import instrument, register_counters
+
+DB_PATH = os.environ.get("FOODLOG_DB", "scale_logger/foodlog.db")
+
+# Stored in PRAGMA user_version once initialize_db() has brought a
+# database up to date. Bump it whenever initialize_db() changes the schema
+# or the seed data, so existing databases take the slow path once.
+SCHEMA_VERSION = 1
+
+# Connection tuning applied once per connection.
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 256
+PAGE_CACHE_KB = 16384
+
+# "strict": log_entry commits before returning. "batched": log_entry
+# journals the entry and a background writer group-commits it; see
+# scale_logger/writebehind.py and set_durability().
+DURABILITY = os.environ.get("FOODLOG_DURABILITY", "strict")
+JOURNAL_SUFFIX = "-pending.jsonl"
+
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+_generation = 0
+
+# name -> id for the lookup tables (and year -> file for the archives),
+# loaded in one read and shared by all threads. None means "not loaded";
+# see _lookup().
+_names = None
+
+_write_behind = None
+
+# Memoized report results: (function, arguments) -> (version, result),
+# least recently used first. See _memoized().
+REPORT_CACHE_SIZE = 128
+_report_cache = OrderedDict()
+_report_cache_lock = threading.Lock()
+_report_cache_counts = {"hits": 0, "misses": 0, "evictions": 0}
+_write_version = 0
 
-DB_PATH = "scale_logger/foodlog.db"
+# Called with every change made through this module; see add_listener().
+_listeners = []
+
+def _open():
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=False,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size=-{PAGE_CACHE_KB}")
+    # Used by the INSERTs into logs to fill ts_us/utc_offset from the
+    # ISO timestamp; see epoch_us().
+    conn.create_function("epoch_us", 1, lambda ts: _epoch_fields(ts)[0], deterministic=True)
+    conn.create_function("utc_offset_min", 1, lambda ts: _epoch_fields(ts)[1], deterministic=True)
+    return conn
 
 def connect():
-    return sqlite3.connect(DB_PATH)
+    """Return this thread's long-lived connection, opening it on first use."""
+    global _names
+    conn = getattr(_local, "conn", None)
+    if (conn is not None and _local.generation == _generation
+            and _local.path == DB_PATH):
+        return conn
+    conn = _open()
+    with _connections_lock:
+        _connections.append(conn)
+        _local.conn = conn
+        _local.generation = _generation
+        _local.path = DB_PATH
+        _local.data_version = None
+    # The cache may have been filled from another file or before writes
+    # this connection has no data_version history for.
+    _names = None
+    return conn
+
+def close():
+    """Close every connection opened by connect(); safe to call repeatedly."""
+    global _generation, _write_behind
+    if _write_behind is not None:
+        _write_behind.close()  # commits anything still queued
+        _write_behind = None
+    with _connections_lock:
+        _generation += 1
+        conns = _connections[:]
+        _connections.clear()
+    for conn in conns:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+    clear_report_cache()
+
+atexit.register(close)
+
+def close_thread():
+    """Close the calling thread's connection, if it has one. Short-lived
+    threads call this before they exit; otherwise their connection stays
+    open until close()."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        return
+    _local.conn = None
+    with _connections_lock:
+        if conn in _connections:
+            _connections.remove(conn)
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+    # Cached reports are keyed on id(conn), which a later connection may reuse.
+    clear_report_cache()
+
+def set_durability(mode, batch_size=None, flush_ms=None, fsync=False):
+    """Switch log_entry between "strict" and "batched" durability.
+    Leaving batched mode commits everything still queued."""
+    global _write_behind, DURABILITY
+    if mode not in ("strict", "batched"):
+        raise ValueError(f"Unknown durability mode: {mode!r}")
+    if _write_behind is not None:
+        _write_behind.close()
+        _write_behind = None
+    if mode == "batched":
+        from scale_logger import writebehind
+        _write_behind = writebehind.WriteBehindLog(
+            DB_PATH + JOURNAL_SUFFIX,
+            batch_size or writebehind.BATCH_SIZE,
+            flush_ms or writebehind.FLUSH_MS,
+            fsync)
+    DURABILITY = mode
+
+@instrument()
+def flush_pending():
+    """Commit entries queued by batched durability, if any."""
+    if _write_behind is not None:
+        _write_behind.flush()
+
+def _read_with_pending(read):
+    """(read(conn), entries) where entries are those acknowledged in
+    batched mode that read's rows don't include yet. The writer commits a
+    batch before it leaves the queue, so the queue is copied first and
+    then filtered by the applied_seq read in the same transaction as the
+    rows; anything committed in between is counted once, from the table."""
+    conn = connect()
+    if _write_behind is None:
+        return read(conn), []
+    pending = _write_behind.pending_entries()
+    own = not conn.in_transaction
+    if own:
+        conn.execute("BEGIN")
+    try:
+        result = read(conn)
+        applied = conn.execute("SELECT applied_seq FROM write_behind WHERE id = 1").fetchone()[0]
+    finally:
+        if own:
+            conn.commit()
+    return result, [e for e in pending if e["seq"] > applied]
+
+def _bump():
+    """Note a write made through this module: cached reports computed
+    before it are stale."""
+    global _write_version
+    _write_version += 1
+
+def _version(conn):
+    # Writes through this module bump _write_version; raw SQL on this
+    # connection still shows up in total_changes, and commits by any
+    # other connection (another thread or process) change data_version.
+    return (_write_version, id(conn),
+            conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes)
+
+def _memoized(fn):
+    """Cache fn's results per positional arguments (which must already be
+    normalized and hashable) until the database changes. Cached results
+    are shared between callers; don't modify them."""
+    @functools.wraps(fn)
+    def wrapper(*args):
+        key = (fn.__name__, args)
+        version = _version(connect())
+        with _report_cache_lock:
+            cached = _report_cache.get(key)
+            if cached is not None and cached[0] == version:
+                _report_cache.move_to_end(key)
+                _report_cache_counts["hits"] += 1
+                return cached[1]
+            _report_cache_counts["misses"] += 1
+        result = fn(*args)
+        with _report_cache_lock:
+            _report_cache[key] = (version, result)
+            _report_cache.move_to_end(key)
+            while len(_report_cache) > REPORT_CACHE_SIZE:
+                _report_cache.popitem(last=False)
+                _report_cache_counts["evictions"] += 1
+        return result
+    return wrapper
+
+def report_cache_info():
+    """Hit/miss/eviction counters and current size of the report cache."""
+    with _report_cache_lock:
+        return dict(_report_cache_counts, size=len(_report_cache), maxsize=REPORT_CACHE_SIZE)
+
+def clear_report_cache():
+    with _report_cache_lock:
+        _report_cache.clear()
+
+register_counters("db.report_cache", report_cache_info)
+
+def add_listener(fn):
+    """Call fn(event) after each log, delete and undo made through this
+    module, on the thread that made it, so keep fn quick (e.g. put the
+    event on a queue). event is a dict; for action "record", "delete" and
+    "undelete" it holds the change to one daily_totals cell:
+
+        {"action": "delete", "day": "2025-05-01", "source": "Safeway",
+         "type": "Dry", "weight": -12.5, "count": -1}
+
+    Action "bulk" (log_entries) carries no cell; re-read what you need.
+    Writes by other processes, sync imports and archiving are not
+    reported; watch PRAGMA data_version for those."""
+    _listeners.append(fn)
+
+def remove_listener(fn):
+    if fn in _listeners:
+        _listeners.remove(fn)
+
+def _notify(event):
+    for fn in list(_listeners):
+        try:
+            fn(event)
+        except Exception as e:
+            print(f"⚠️ db listener {fn!r} failed: {e}")
+
+ENTRY_CELL_SQL = """
+    SELECT substr(logs.timestamp, 1, 10), s.name, t.name, logs.weight_lb
+    FROM logs
+    JOIN sources s ON s.id = logs.source_id
+    JOIN types t ON t.id = logs.type_id
+    WHERE logs.id = ?
+    """
+
+def _notify_cell(conn, action, record_id, sign):
+    day, source, dtype, weight = conn.execute(ENTRY_CELL_SQL, (record_id,)).fetchone()
+    _notify({"action": action, "day": day, "source": source, "type": dtype,
+             "weight": sign * weight, "count": sign})
+
+def _load_names(conn):
+    names = {"sources": {}, "types": {}}
+    rows = conn.execute(
+        "SELECT 'sources', name, id, 0 FROM sources "
+        "UNION ALL SELECT 'types', name, id, sort_order FROM types "
+        "ORDER BY 1, 4, 2"
+    )
+    for table, name, id_, _ in rows:
+        names[table][name] = id_
+    names["archives"] = dict(conn.execute("SELECT year, file FROM archives"))
+    return names
+
+def _lookup(reload=False):
+    """Return the cached lookup tables, reloading them if another
+    connection has committed since this thread last looked."""
+    global _names
+    conn = connect()
+    version = conn.execute("PRAGMA data_version").fetchone()[0]
+    seen, _local.data_version = _local.data_version, version
+    names = _names
+    if reload or names is None or (seen is not None and seen != version):
+        names = _names = _load_names(conn)
+    return names
 
+def _remember(table, name, id_):
+    names = _names
+    if names is not None:
+        names[table][name] = id_
+
+
+@instrument()
 def initialize_db():
+    """Create or upgrade the schema, seed the lookup tables and replay the
+    write-behind journal. A database already at SCHEMA_VERSION with an
+    empty journal costs one PRAGMA read."""
     conn = connect()
-    c = conn.cursor()
-
-    c.execute('''CREATE TABLE IF NOT EXISTS sources (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT UNIQUE NOT NULL
-    )''')
-
-    c.execute('''CREATE TABLE IF NOT EXISTS types (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT UNIQUE NOT NULL,
-        sort_order INTEGER DEFAULT 0
-    )''')
-
-    c.execute('''CREATE TABLE IF NOT EXISTS logs (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        timestamp TEXT NOT NULL,
-        weight_lb REAL NOT NULL,
-        source_id INTEGER NOT NULL,
-        type_id INTEGER NOT NULL,
-        action TEXT NOT NULL CHECK(action IN ('record', 'delete')) DEFAULT 'record',
-        FOREIGN KEY(source_id) REFERENCES sources(id),
-        FOREIGN KEY(type_id) REFERENCES types(id)
-    )''')
+    if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+        _create_schema(conn)
+
+    if _write_behind is None:
+        journal = DB_PATH + JOURNAL_SUFFIX
+        if DURABILITY == "batched":
+            from scale_logger import writebehind
+            try:
+                set_durability("batched")  # replays the journal first
+            except writebehind.JournalInUse as e:
+                print(f"⚠️ {e}; logging in strict mode instead")
+                set_durability("strict")
+        elif os.path.exists(journal) and os.path.getsize(journal):
+            from scale_logger import writebehind
+            writebehind.replay_journal(journal)
+
+def _create_schema(conn):
+    with conn:
+        c = conn.cursor()
+
+        c.execute('''CREATE TABLE IF NOT EXISTS sources (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL
+        )''')
+
+        c.execute('''CREATE TABLE IF NOT EXISTS types (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            sort_order INTEGER DEFAULT 0
+        )''')
+
+        c.execute('''CREATE TABLE IF NOT EXISTS logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            weight_lb REAL NOT NULL,
+            source_id INTEGER NOT NULL,
+            type_id INTEGER NOT NULL,
+            action TEXT NOT NULL CHECK(action IN ('record', 'delete')) DEFAULT 'record',
+            ref_id INTEGER REFERENCES logs(id),
+            ts_us INTEGER,
+            utc_offset INTEGER,
+            FOREIGN KEY(source_id) REFERENCES sources(id),
+            FOREIGN KEY(type_id) REFERENCES types(id)
+        )''')
+        _add_epoch_columns(c)
+
+        # Closed years moved out of logs; see scale_logger/archive.py.
+        c.execute('''CREATE TABLE IF NOT EXISTS archives (
+            year INTEGER PRIMARY KEY,
+            file TEXT NOT NULL,
+            rows INTEGER NOT NULL,
+            archived_at TEXT NOT NULL
+        )''')
+
+    # Outside the schema transaction: it commits one batch at a time.
+    migrate_timestamps()
+
+    with conn:
+        c = conn.cursor()
+        migrated = _link_tombstones(c)
+
+        # Access paths for the hot queries below (see HOT_QUERIES).
+        for old in ("idx_logs_source_action_ts", "idx_logs_source_ts",
+                    "idx_logs_action_ts", "idx_logs_ts"):
+            c.execute(f"DROP INDEX IF EXISTS {old}")
+        c.execute('''CREATE INDEX IF NOT EXISTS idx_logs_source_us
+            ON logs(source_id, action, ts_us)''')
+        c.execute('''CREATE INDEX IF NOT EXISTS idx_logs_action_us
+            ON logs(action, ts_us)''')
+        c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_logs_ref
+            ON logs(ref_id) WHERE ref_id IS NOT NULL''')
+        if migrated:
+            _backfill_tombstones(c)
+
+        _create_rollup(c, rebuild=migrated)
+    _bump()
 
     seed_sources()
     seed_types()
-    conn.commit()
-    conn.close()
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+# Every log row carries its time twice: timestamp is the local ISO text
+# that is displayed, exported and used as the rollup's day key, and
+# ts_us/utc_offset are the same instant as integer microseconds since the
+# Unix epoch plus the local UTC offset in minutes. Ordering and range
+# queries use ts_us, so the indexes hold 8-byte integers rather than
+# 26-byte strings and day bounds are exact half-open [start, end) ranges.
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+EPOCH_BATCH = 5000
+
+@functools.lru_cache(maxsize=64)
+def _epoch_fields(ts):
+    dt = datetime.fromisoformat(ts) if isinstance(ts, str) else ts
+    if dt.tzinfo is None:
+        dt = dt.astimezone()  # naive timestamps are local time
+    return (dt - EPOCH) // timedelta(microseconds=1), dt.utcoffset() // timedelta(minutes=1)
+
+def epoch_us(ts):
+    """Microseconds since the Unix epoch for a datetime or ISO string.
+    Naive values are taken as local time."""
+    return _epoch_fields(ts)[0]
+
+def from_epoch_us(us, utc_offset=None):
+    """The aware datetime for an epoch-microsecond value, in the given UTC
+    offset (minutes) or local time when it is None."""
+    dt = EPOCH + timedelta(microseconds=us)
+    if utc_offset is None:
+        return dt.astimezone()
+    return dt.astimezone(timezone(timedelta(minutes=utc_offset)))
+
+def _add_epoch_columns(c):
+    columns = [row[1] for row in c.execute("PRAGMA table_info(logs)")]
+    if "ts_us" not in columns:
+        c.execute("ALTER TABLE logs ADD COLUMN ts_us INTEGER")
+        c.execute("ALTER TABLE logs ADD COLUMN utc_offset INTEGER")
+    # Also how migrate_timestamps() finds the rows it still has to fill.
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_logs_us
+        ON logs(ts_us)''')
+
+@instrument()
+def migrate_timestamps(batch_size=EPOCH_BATCH, progress=None):
+    """Fill ts_us/utc_offset for rows written without them (databases from
+    before the columns existed, or rows inserted by other tools). Commits
+    every batch_size rows so other connections can keep writing; safe to
+    interrupt and run again. progress(done) is called after each batch.
+    Returns the number of rows updated."""
+    conn = connect()
+    done = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, timestamp FROM logs WHERE ts_us IS NULL ORDER BY id LIMIT ?",
+            (batch_size,)
+        ).fetchall()
+        if not rows:
+            return done
+        with conn:
+            conn.executemany(
+                "UPDATE logs SET ts_us = ?, utc_offset = ? WHERE id = ?",
+                ((*_epoch_fields(ts), id_) for id_, ts in rows))
+        _bump()
+        done += len(rows)
+        if progress:
+            progress(done)
+
+# A 'delete' row is a tombstone: ref_id points at the 'record' row it
+# cancels, and idx_logs_ref makes "is this record cancelled?" one index
+# probe. At most one tombstone may point at a record.
+NOT_CANCELLED = "NOT EXISTS (SELECT 1 FROM logs d WHERE d.ref_id = logs.id)"
+
+def _link_tombstones(c):
+    """Add logs.ref_id to databases created before tombstones were
+    linked. Returns True if the column was added, in which case the old
+    rollup triggers are dropped and existing tombstones need a backfill."""
+    columns = [row[1] for row in c.execute("PRAGMA table_info(logs)")]
+    if "ref_id" in columns:
+        return False
+    c.execute("ALTER TABLE logs ADD COLUMN ref_id INTEGER REFERENCES logs(id)")
+    triggers = c.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_logs_rollup_%'"
+    ).fetchall()
+    for (name,) in triggers:
+        c.execute(f"DROP TRIGGER {name}")
+    return True
+
+_BACKFILL_MATCH_SQL = f"""
+    SELECT id FROM logs
+    WHERE source_id = ? AND action = 'record' AND ts_us <= ?
+      AND type_id = ? AND weight_lb = ? AND {NOT_CANCELLED}
+    ORDER BY ts_us DESC, id DESC
+    LIMIT 1
+    """
+
+def _backfill_tombstones(c):
+    """Best-effort link of unlinked tombstones, oldest first: each one is
+    matched to the newest still-uncancelled record with the same source,
+    type and weight logged at or before it. Tombstones with no match keep
+    ref_id NULL and cancel nothing."""
+    tombstones = c.execute(
+        "SELECT id, ts_us, source_id, type_id, weight_lb FROM logs "
+        "WHERE action = 'delete' AND ref_id IS NULL ORDER BY ts_us, id"
+    ).fetchall()
+    for id_, ts, source_id, type_id, weight in tombstones:
+        match = c.execute(_BACKFILL_MATCH_SQL, (source_id, ts, type_id, weight)).fetchone()
+        if match:
+            c.execute("UPDATE logs SET ref_id = ? WHERE id = ?", (match[0], id_))
+
+# daily_totals is a per-day rollup of recorded weight, kept in step with
+# logs by triggers so that reports never have to read raw rows. A record
+# counts towards the day in its timestamp unless a tombstone cancels it;
+# inserting or removing a tombstone takes its target out of or puts it
+# back into the rollup.
+#
+# {r} is the row whose weight is added or taken away and {rows} is where
+# it comes from: "WHERE true" for NEW/OLD themselves, or _TOMBSTONE_TARGET
+# for the record a tombstone points at.
+_ROLLUP_ADD = """
+    INSERT INTO daily_totals (day, source_id, type_id, weight, count)
+    SELECT substr({r}.timestamp, 1, 10), {r}.source_id, {r}.type_id, {r}.weight_lb, 1 {rows}
+    ON CONFLICT(source_id, day, type_id) DO UPDATE
+    SET weight = weight + excluded.weight, count = count + excluded.count;
+"""
+_ROLLUP_SUB = """
+    INSERT INTO daily_totals (day, source_id, type_id, weight, count)
+    SELECT substr({r}.timestamp, 1, 10), {r}.source_id, {r}.type_id, -{r}.weight_lb, -1 {rows}
+    ON CONFLICT(source_id, day, type_id) DO UPDATE
+    SET weight = weight + excluded.weight, count = count + excluded.count;
+    DELETE FROM daily_totals
+    WHERE count <= 0 AND (source_id, day, type_id) IN (
+        SELECT {r}.source_id, substr({r}.timestamp, 1, 10), {r}.type_id {rows});
+"""
+_TOMBSTONE_TARGET = "FROM logs t WHERE t.id = {r}.ref_id AND t.action = 'record'"
+_IS_LIVE_RECORD = ("{r}.action = 'record' "
+                   "AND NOT EXISTS (SELECT 1 FROM logs d WHERE d.ref_id = {r}.id)")
+_IS_LINKED_TOMBSTONE = "{r}.action = 'delete' AND {r}.ref_id IS NOT NULL"
+
+def _rollup_trigger(name, event, when, body, r, target=False):
+    rows = dict(r="t", rows=_TOMBSTONE_TARGET.format(r=r)) if target else dict(r=r, rows="WHERE true")
+    return f'''CREATE TRIGGER IF NOT EXISTS {name}
+        AFTER {event} ON logs WHEN {when.format(r=r)}
+        BEGIN {body.format(**rows)} END'''
+
+def _create_rollup(c, rebuild=False):
+    exists = c.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_totals'"
+    ).fetchone()
+    c.execute('''CREATE TABLE IF NOT EXISTS daily_totals (
+        day TEXT NOT NULL,
+        source_id INTEGER NOT NULL,
+        type_id INTEGER NOT NULL,
+        weight REAL NOT NULL DEFAULT 0,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (source_id, day, type_id)
+    ) WITHOUT ROWID''')
+    record_update = "UPDATE OF timestamp, weight_lb, source_id, type_id, action"
+    tombstone_update = "UPDATE OF action, ref_id"
+    for trigger in (
+        # A new record can't be cancelled yet.
+        ("trg_logs_rollup_insert", "INSERT", "{r}.action = 'record'", _ROLLUP_ADD, "NEW"),
+        ("trg_logs_rollup_delete", "DELETE", _IS_LIVE_RECORD, _ROLLUP_SUB, "OLD"),
+        ("trg_logs_rollup_update_old", record_update, _IS_LIVE_RECORD, _ROLLUP_SUB, "OLD"),
+        ("trg_logs_rollup_update_new", record_update, _IS_LIVE_RECORD, _ROLLUP_ADD, "NEW"),
+        # Tombstones move their target record out of and back into the rollup.
+        ("trg_logs_rollup_cancel", "INSERT", _IS_LINKED_TOMBSTONE, _ROLLUP_SUB, "NEW", True),
+        ("trg_logs_rollup_restore", "DELETE", _IS_LINKED_TOMBSTONE, _ROLLUP_ADD, "OLD", True),
+        ("trg_logs_rollup_relink_old", tombstone_update, _IS_LINKED_TOMBSTONE, _ROLLUP_ADD, "OLD", True),
+        ("trg_logs_rollup_relink_new", tombstone_update, _IS_LINKED_TOMBSTONE, _ROLLUP_SUB, "NEW", True),
+    ):
+        c.execute(_rollup_trigger(*trigger))
+    if rebuild or not exists:
+        _rebuild_rollup(c)
+
+_ROLLUP_FROM_LOGS_SQL = f"""
+    SELECT substr(timestamp, 1, 10), source_id, type_id, SUM(weight_lb), COUNT(*)
+    FROM logs WHERE action = 'record' AND {NOT_CANCELLED}
+    GROUP BY 1, 2, 3
+    """
+
+def _rebuild_rollup(c):
+    c.execute("DELETE FROM daily_totals")
+    c.execute("INSERT INTO daily_totals (day, source_id, type_id, weight, count) "
+              + _ROLLUP_FROM_LOGS_SQL)
+
+@instrument()
+def rebuild_daily_totals():
+    conn = connect()
+    with conn:
+        _rebuild_rollup(conn)
+    _bump()
+
+@instrument()
+def verify_daily_totals(tolerance=1e-6):
+    """Recompute the rollup from the raw log and diff it against
+    daily_totals. Returns a list of (day, source, type, expected, actual)
+    where expected/actual are (weight, count) or None; empty means they
+    agree."""
+    conn = connect()
+    with conn:  # one read snapshot for both sides
+        expected = {r[:3]: r[3:] for r in conn.execute(_ROLLUP_FROM_LOGS_SQL)}
+        actual = {r[:3]: r[3:] for r in conn.execute(
+            "SELECT day, source_id, type_id, weight, count FROM daily_totals")}
+    sources = {v: k for k, v in _lookup()["sources"].items()}
+    types = {v: k for k, v in _lookup()["types"].items()}
+    diffs = []
+    for key in sorted(expected.keys() | actual.keys()):
+        exp, act = expected.get(key), actual.get(key)
+        if exp and act and exp[1] == act[1] and abs(exp[0] - act[0]) <= tolerance:
+            continue
+        day, source_id, type_id = key
+        diffs.append((day, sources.get(source_id, source_id),
+                      types.get(type_id, type_id), exp, act))
+    return diffs
 
+@instrument()
 def seed_sources():
     default_sources = [
         "Food for Neighbors", "Trader Joe's", "Whole Foods", "Wegmans", "Safeway",
         "Good Shepherd donations", "FreshFarm St John Neumann"
     ]
     conn = connect()
-    for name in default_sources:
-        conn.execute("INSERT OR IGNORE INTO sources (name) VALUES (?)", (name,))
-    conn.commit()
-    conn.close()
+    with conn:
+        for name in default_sources:
+            _insert_source(conn, name)
 
+@instrument()
 def seed_types():
     default_types = [
         "Produce", "Dry", "Dairy", "Meat", "Prepared", "Bread", "Non-Food"
     ]
     conn = connect()
-    for i, name in enumerate(default_types):
-        conn.execute("INSERT OR IGNORE INTO types (name, sort_order) VALUES (?, ?)", (name, i))
-    conn.commit()
-    conn.close()
+    with conn:
+        for i, name in enumerate(default_types):
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO types (name, sort_order) VALUES (?, ?)", (name, i))
+            if cur.rowcount:
+                _remember("types", name, cur.lastrowid)
+                _bump()
 
-def get_sources():
+def _insert_source(conn, name):
+    cur = conn.execute("INSERT OR IGNORE INTO sources (name) VALUES (?)", (name,))
+    if cur.rowcount:
+        _remember("sources", name, cur.lastrowid)
+        _bump()
+
+@instrument()
+def add_source(name):
     conn = connect()
-    rows = conn.execute("SELECT name FROM sources ORDER BY name").fetchall()
-    conn.close()
-    return [r[0] for r in rows]
+    with conn:
+        _insert_source(conn, name)
 
+@instrument()
+def get_sources():
+    return sorted(_lookup()["sources"])
+
+@instrument()
 def get_types():
-    conn = connect()
-    rows = conn.execute("SELECT name FROM types ORDER BY sort_order").fetchall()
-    conn.close()
-    return [r[0] for r in rows]
+    return list(_lookup()["types"])
 
+@instrument()
 def get_id_by_name(table, name):
-    conn = connect()
-    row = conn.execute(f"SELECT id FROM {table} WHERE name = ?", (name,)).fetchone()
-    conn.close()
-    return row[0] if row else None
+    id_ = _lookup()[table].get(name)
+    if id_ is None:
+        # A name added by another connection may predate this thread's
+        # first data_version check; look once more before giving up.
+        id_ = _lookup(reload=True)[table].get(name)
+    return id_
+
+@instrument()
+def resolve_id(table, name):
+    """Like get_id_by_name, but raise ValueError for unknown names."""
+    id_ = get_id_by_name(table, name)
+    if id_ is None:
+        kind = "source" if table == "sources" else "type"
+        raise ValueError(f"Unknown {kind}: {name!r}")
+    return id_
 
+INSERT_RECORD_SQL = """
+    INSERT INTO logs (timestamp, weight_lb, source_id, type_id, action, ts_us, utc_offset)
+    VALUES (?1, ?2, ?3, ?4, 'record', epoch_us(?1), utc_offset_min(?1))
+    """
+
+@instrument()
 def log_entry(weight, dtype, source):
-    source_id = get_id_by_name("sources", source)
-    type_id = get_id_by_name("types", dtype)
+    source_id = resolve_id("sources", source)
+    type_id = resolve_id("types", dtype)
+    ts = datetime.now().isoformat()
+    if _write_behind is not None:
+        _write_behind.submit(ts, weight, dtype, source)
+        _bump()  # create_report counts queued entries too
+    else:
+        conn = connect()
+        with conn:
+            conn.execute(INSERT_RECORD_SQL, (ts, weight, source_id, type_id))
+        _bump()
+    if _listeners:
+        _notify({"action": "record", "day": ts[:10], "source": source, "type": dtype,
+                 "weight": weight, "count": 1})
+
+def _unpack_entry(entry):
+    if isinstance(entry, dict):
+        return (entry.get("weight", entry.get("weight_lb")),
+                entry.get("type", entry.get("type_name")),
+                entry.get("source", entry.get("source_name")),
+                entry.get("timestamp"))
+    weight, dtype, source, *rest = entry
+    return weight, dtype, source, (rest[0] if rest else None)
+
+@instrument()
+def log_entries(entries):
+    """Insert many 'record' entries in a single transaction.
+
+    Each entry is a (weight, type, source[, timestamp]) tuple or a dict
+    with those keys ("weight_lb", "type_name" and "source_name" are
+    accepted too). Entries without a timestamp get the current time.
+    Names are resolved once per distinct name and rows are streamed into
+    executemany, so entries can be any iterable, including a generator
+    over a large file.
+
+    A bad entry (non-positive weight, unknown name, bad timestamp) is
+    skipped and reported; the rest of the batch is still inserted. An
+    entry that is itself a ValueError, such as a reader's parse error for
+    one line, is reported the same way.
+    Returns (inserted_count, failures) where failures is a list of
+    (index, entry, error message).
+    """
+    names = _lookup()
+    unknown = set()
+    failures = []
+
+    def resolve(table, name):
+        id_ = names[table].get(name)
+        if id_ is None and (table, name) not in unknown:
+            id_ = get_id_by_name(table, name)
+            if id_ is None:
+                unknown.add((table, name))
+        return id_
+
+    def rows():
+        now = datetime.now().isoformat()
+        for index, entry in enumerate(entries):
+            try:
+                if isinstance(entry, ValueError):
+                    raise entry
+                weight, dtype, source, ts = _unpack_entry(entry)
+                weight = float(weight)
+                if not weight > 0:
+                    raise ValueError(f"Invalid weight: {weight}")
+                source_id = resolve("sources", source)
+                if source_id is None:
+                    raise ValueError(f"Unknown source: {source!r}")
+                type_id = resolve("types", dtype)
+                if type_id is None:
+                    raise ValueError(f"Unknown type: {dtype!r}")
+                ts = datetime.fromisoformat(str(ts)).isoformat() if ts else now
+            except (TypeError, ValueError) as e:
+                failures.append((index, entry, str(e)))
+                continue
+            yield ts, weight, source_id, type_id
+
     conn = connect()
-    conn.execute(
-        "INSERT INTO logs (timestamp, weight_lb, source_id, type_id, action) VALUES (?, ?, ?, ?, 'record')",
-        (datetime.now().isoformat(), weight, source_id, type_id)
-    )
-    conn.commit()
-    conn.close()
+    with conn:
+        inserted = conn.executemany(INSERT_RECORD_SQL, rows()).rowcount
+    _bump()
+    if _listeners and inserted > 0:
+        _notify({"action": "bulk", "count": inserted})
+    return max(inserted, 0), failures
 
+LAST_RECORD_SQL = f"""
+    SELECT id FROM logs WHERE action = 'record' AND {NOT_CANCELLED}
+    ORDER BY ts_us DESC, id DESC LIMIT 1
+    """
+LAST_TOMBSTONE_SQL = """
+    SELECT id FROM logs WHERE action = 'delete' AND ref_id IS NOT NULL
+    ORDER BY ts_us DESC, id DESC LIMIT 1
+    """
+
+@instrument()
 def delete_last_entry():
+    """Cancel the newest record that isn't cancelled yet with a tombstone
+    pointing at it. Returns the cancelled record's id, or None."""
+    flush_pending()
     conn = connect()
-    row = conn.execute(
-        "SELECT id FROM logs WHERE action = 'record' ORDER BY timestamp DESC LIMIT 1"
-    ).fetchone()
+    with conn:
+        row = conn.execute(LAST_RECORD_SQL).fetchone()
+        if row:
+            conn.execute(
+                "INSERT INTO logs (timestamp, weight_lb, source_id, type_id, action, ref_id, ts_us, utc_offset) "
+                "SELECT ?1, weight_lb, source_id, type_id, 'delete', id, epoch_us(?1), utc_offset_min(?1) "
+                "FROM logs WHERE id = ?2",
+                (datetime.now().isoformat(), row[0])
+            )
     if row:
-        conn.execute(
-            "INSERT INTO logs (timestamp, weight_lb, source_id, type_id, action) "
-            "SELECT ?, weight_lb, source_id, type_id, 'delete' FROM logs WHERE id = ?",
-            (datetime.now().isoformat(), row[0])
-        )
-        conn.commit()
-    conn.close()
+        _bump()
+        if _listeners:
+            _notify_cell(conn, "delete", row[0], -1)
+        return row[0]
 
+@instrument()
 def undelete_last_entry():
+    """Remove the newest tombstone, restoring the record it cancelled.
+    Returns the restored record's id, or None."""
+    flush_pending()
     conn = connect()
-    row = conn.execute(
-        "SELECT id FROM logs WHERE action = 'delete' ORDER BY timestamp DESC LIMIT 1"
-    ).fetchone()
+    with conn:
+        row = conn.execute(
+            "SELECT id, ref_id FROM logs WHERE id = (" + LAST_TOMBSTONE_SQL + ")"
+        ).fetchone()
+        if row:
+            conn.execute(
+                "DELETE FROM logs WHERE id = ?", (row[0],)
+            )
     if row:
-        conn.execute(
-            "DELETE FROM logs WHERE id = ?", (row[0],)
-        )
-        conn.commit()
-    conn.close()
+        _bump()
+        if _listeners:
+            _notify_cell(conn, "undelete", row[1], 1)
+        return row[1]
+
+LOG_PAGE_SIZE = 500
 
+def logs_page_sql(source=False, dtype=False, since=False, until=False,
+                  action=False, after=False, live=False):
+    """Build the keyset-paginated log query; each flag adds a filter (and
+    its placeholder) in the order of the parameters, and live drops
+    cancelled records. CROSS JOIN pins logs
+    as the outer loop so the planner always walks a logs index in
+    (ts_us, id) order instead of sorting."""
+    where = []
+    if source:
+        where.append("logs.source_id = ?")
+    if dtype:
+        where.append("logs.type_id = ?")
+    if action:
+        where.append("logs.action = ?")
+    if since:
+        where.append("logs.ts_us >= ?")
+    if until:
+        where.append("logs.ts_us < ?")
+    if after:
+        where.append("(logs.ts_us, logs.id) < (?, ?)")
+    if live:
+        where.append(NOT_CANCELLED)
+    return f"""
+    SELECT logs.id, logs.ts_us, logs.timestamp, logs.weight_lb, s.name, t.name, logs.action
+    FROM logs
+    CROSS JOIN sources s ON s.id = logs.source_id
+    CROSS JOIN types t ON t.id = logs.type_id
+    {"WHERE " + " AND ".join(where) if where else ""}
+    ORDER BY logs.ts_us DESC, logs.id DESC
+    LIMIT ?
+    """
+
+@instrument()
+def iter_logs(source=None, dtype=None, since=None, until=None, action="record",
+              page_size=LOG_PAGE_SIZE):
+    """Yield (timestamp, weight_lb, source, type, action) rows, newest first.
+
+    Rows are fetched page_size at a time with keyset pagination on
+    (ts_us, id), so memory use is constant and the first row is
+    available as soon as the first page is read. since/until are
+    YYYY-MM-DD dates (inclusive). action="record" skips records that have
+    been deleted; action=None includes them and the 'delete' tombstones.
+    Archived years in the range follow the main database's rows.
+    """
+    filters = []
+    if source is not None:
+        filters.append(resolve_id("sources", source))
+    if dtype is not None:
+        filters.append(resolve_id("types", dtype))
+    if action is not None:
+        filters.append(action)
+    if since is not None:
+        filters.append(day_range_us(since)[0])
+    if until is not None:
+        filters.append(day_range_us(until)[1])
+    flush_pending()
+    flags = dict(source=source is not None, dtype=dtype is not None,
+                 action=action is not None, since=since is not None,
+                 until=until is not None, live=action == "record")
+    first_page = logs_page_sql(**flags)
+    next_page = logs_page_sql(after=True, **flags)
+
+    conn = connect()
+    # Newest first: the main database, then archived years newest first.
+    schemas = [None, *reversed(archive_schemas(since, until))]
+    for schema in schemas:
+        first, after = ((first_page, next_page) if schema is None else
+                        (in_schema(first_page, schema), in_schema(next_page, schema)))
+        rows = conn.execute(first, (*filters, page_size)).fetchall()
+        while rows:
+            for row in rows:
+                yield row[2:]
+            if len(rows) < page_size:
+                break
+            last_id, last_ts = rows[-1][0], rows[-1][1]
+            rows = conn.execute(after, (*filters, last_ts, last_id, page_size)).fetchall()
+
+@instrument()
 def get_all_logs(include_deleted=False):
-    query = """
-    SELECT logs.timestamp, logs.weight_lb, s.name, t.name, logs.action
+    return list(iter_logs(action=None if include_deleted else "record"))
+
+SOURCE_LOGS_SQL = f"""
+    SELECT logs.id, logs.timestamp, logs.weight_lb, s.name, t.name, logs.action
     FROM logs
     JOIN sources s ON s.id = logs.source_id
     JOIN types t ON t.id = logs.type_id
+    WHERE logs.source_id = ? AND logs.action = 'record'
+      AND logs.ts_us >= ? AND logs.ts_us < ? AND {NOT_CANCELLED}
+    ORDER BY logs.ts_us ASC, logs.id ASC
     """
-    if not include_deleted:
-        query += " WHERE logs.action = 'record'"
-    query += " ORDER BY logs.timestamp DESC"
 
+RANGE_LOGS_SQL = f"""
+    SELECT logs.id, logs.timestamp, logs.weight_lb, s.name, t.name, logs.action
+    FROM logs
+    CROSS JOIN sources s ON s.id = logs.source_id
+    CROSS JOIN types t ON t.id = logs.type_id
+    WHERE logs.action = 'record' AND logs.ts_us >= ? AND logs.ts_us < ?
+      AND {NOT_CANCELLED}
+    ORDER BY logs.ts_us ASC, logs.id ASC
+    """
+RANGE_COUNT_SQL = f"""
+    SELECT COUNT(*) FROM logs
+    WHERE action = 'record' AND ts_us >= ? AND ts_us < ? AND {NOT_CANCELLED}
+    """
+
+def day_range(start_date, end_date=None):
+    """Half-open [start, end) timestamp bounds covering whole days."""
+    end_date = end_date or start_date
+    end = datetime.fromisoformat(end_date).date() + timedelta(days=1)
+    return start_date + "T00:00", end.isoformat() + "T00:00"
+
+def day_range_us(start_date, end_date=None):
+    """day_range() as ts_us bounds: local midnight to local midnight, so a
+    day is 23 or 25 hours long across a DST change."""
+    start, end = day_range(start_date, end_date)
+    return epoch_us(start), epoch_us(end)
+
+# Closed years can be moved out of logs into one file per year, each with
+# its own logs and daily_totals (see scale_logger/archive.py); the
+# archives table lists them. A read whose date range reaches an archived
+# year ATTACHes that file as archive_<year> on the reading connection and
+# runs against it as well as the main tables. Reads that stay within
+# unarchived years never open an archive file.
+MAX_ATTACHED = 10  # SQLite's default SQLITE_MAX_ATTACHED
+
+def archive_path(file):
+    """Where an archive file named in the archives table lives: next to
+    the main database."""
+    return os.path.join(os.path.dirname(DB_PATH), file)
+
+def archive_schemas(start_date=None, end_date=None):
+    """Attach the archives holding any day from start_date to end_date
+    (inclusive YYYY-MM-DD, None for unbounded) to this thread's
+    connection. Returns their schema names, oldest year first."""
+    archives = _lookup()["archives"]
+    years = [y for y in sorted(archives)
+             if (start_date is None or int(start_date[:4]) <= y)
+             and (end_date is None or y <= int(end_date[:4]))]
+    if not years:
+        return []
+    conn = connect()
+    wanted = [f"archive_{y}" for y in years]
+    attached = {row[1] for row in conn.execute("PRAGMA database_list")
+                if row[1].startswith("archive_")}
+    if len(attached | set(wanted)) > MAX_ATTACHED:
+        for schema in attached - set(wanted):
+            conn.execute(f"DETACH DATABASE {schema}")
+    for year, schema in zip(years, wanted):
+        if schema not in attached:
+            path = archive_path(archives[year])
+            if not os.path.exists(path):  # ATTACH would create an empty one
+                raise FileNotFoundError(f"Archive for {year} is missing: {path}")
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+    return wanted
+
+def in_schema(sql, schema):
+    """sql with its logs and daily_totals tables read from schema."""
+    return re.sub(r"\bFROM (logs|daily_totals)\b", rf"FROM {schema}.\1", sql)
+
+def with_archives(sql, schemas):
+    """sql with "FROM daily_totals d" read from the union of the main
+    rollup and the archives' rollups, so GROUP BYs and running totals
+    span them. Plain WHERE terms are pushed into each branch; the rest
+    may scan an archive's rollup, which holds at most a year of days."""
+    if not schemas:
+        return sql
+    union = " UNION ALL ".join(
+        f"SELECT * FROM {schema}.daily_totals" for schema in ["main", *schemas])
+    return sql.replace("FROM daily_totals d", f"FROM ({union}) d")
+
+def execute_range(sql, params, start_date=None, end_date=None):
+    """Run a logs query against every archive covering start_date to
+    end_date (oldest first) and then the main database, yielding the rows
+    of each in turn."""
     conn = connect()
-    return conn.execute(query).fetchall()
+    for schema in archive_schemas(start_date, end_date):
+        yield from conn.execute(in_schema(sql, schema), params)
+    yield from conn.execute(sql, params)
 
-def create_report(source, start_date=None, end_date=None):
+@instrument()
+def get_source_logs(source, start_date, end_date=None):
+    """Recorded rows for one source over whole days, oldest first, as
+    (id, timestamp, weight_lb, source_name, type_name, action)."""
     source_id = get_id_by_name("sources", source)
     if not source_id:
-        return {}, 0.0, []
+        return []
+    flush_pending()
+    params = (source_id, *day_range_us(start_date, end_date))
+    return list(execute_range(SOURCE_LOGS_SQL, params, start_date, end_date or start_date))
+
+REPORT_ROWS_SQL = f"""
+    SELECT t.name, logs.weight_lb
+    FROM logs
+    JOIN types t ON t.id = logs.type_id
+    WHERE logs.source_id = ? AND logs.action = 'record'
+      AND logs.ts_us >= ? AND logs.ts_us < ? AND {NOT_CANCELLED}
+    """
+
+REPORT_TOTALS_SQL = """
+    SELECT t.name, SUM(d.weight)
+    FROM daily_totals d
+    JOIN types t ON t.id = d.type_id
+    WHERE d.source_id = ? AND d.day BETWEEN ? AND ?
+    GROUP BY d.type_id
+    ORDER BY t.sort_order
+    """
 
+# Every source's cells for one day, for totals.TotalsModel. source_id is
+# the first key of daily_totals, so constrain it to keep this a set of
+# primary-key reads however many days the rollup holds.
+DAY_TOTALS_SQL = """
+    SELECT s.name, t.name, d.weight, d.count
+    FROM daily_totals d
+    JOIN sources s ON s.id = d.source_id
+    JOIN types t ON t.id = d.type_id
+    WHERE d.source_id IN (SELECT id FROM sources) AND d.day = ?
+    """
+
+@instrument()
+def create_report(source, start_date=None, end_date=None, include_rows=True):
+    """Category totals for one source over whole days, read from the
+    daily_totals rollup. The raw (type, weight) rows are only fetched
+    when include_rows is true. Results are cached until the next write;
+    treat them as read-only."""
     if start_date is None:
         start_date = datetime.now().date().isoformat()
     if end_date is None:
         end_date = start_date
+    return _create_report(source, start_date, end_date, bool(include_rows))
 
-    query = """
-    SELECT t.name, logs.weight_lb
-    FROM logs
-    JOIN types t ON t.id = logs.type_id
-    WHERE logs.source_id = ? AND logs.timestamp BETWEEN ? AND ? AND logs.action = 'record'
-    """
-    conn = connect()
-    rows = conn.execute(query, (source_id, start_date + "T00:00", end_date + "T23:59")).fetchall()
+@_memoized
+def _create_report(source, start_date, end_date, include_rows):
+    source_id = get_id_by_name("sources", source)
+    if not source_id:
+        return {}, 0.0, []
 
-    cat_totals = {}
-    total_weight = 0.0
-    for cat, wt in rows:
-        cat_totals[cat] = cat_totals.get(cat, 0.0) + wt
-        total_weight += wt
+    # Attach any archives before _read_with_pending opens its transaction.
+    sql = with_archives(REPORT_TOTALS_SQL, archive_schemas(start_date, end_date))
+
+    def read(conn):
+        cat_totals = dict(conn.execute(sql, (source_id, start_date, end_date)))
+        rows = []
+        if include_rows:
+            rows = list(execute_range(REPORT_ROWS_SQL, (source_id, *day_range_us(start_date, end_date)),
+                                      start_date, end_date))
+        return cat_totals, rows
+
+    (cat_totals, rows), pending = _read_with_pending(read)
+    total_weight = sum(cat_totals.values(), 0.0)
+
+    # Entries acknowledged in batched mode but not committed yet.
+    for e in pending:
+        if e["source"] == source and start_date <= e["ts"][:10] <= end_date:
+            cat_totals[e["type"]] = cat_totals.get(e["type"], 0.0) + e["weight"]
+            total_weight += e["weight"]
+            if include_rows:
+                rows.append((e["type"], e["weight"]))
 
     return cat_totals, total_weight, rows
+
+# Dimensions aggregate() can group by: name -> (value, sort key). A week
+# is labelled by its ISO year and number ("2025-W01"); the Thursday of a
+# day's ISO week decides both.
+_ISO_THURSDAY = "date(d.day, '-3 days', 'weekday 4')"
+_ISO_WEEK = (f"strftime('%Y', {_ISO_THURSDAY}) || '-W' || "
+             f"printf('%02d', (strftime('%j', {_ISO_THURSDAY}) - 1) / 7 + 1)")
+AGGREGATE_DIMENSIONS = {
+    "source": ("s.name", "s.name"),
+    "type": ("t.name", "t.sort_order"),
+    "day": ("d.day", "d.day"),
+    "week": (_ISO_WEEK, _ISO_WEEK),
+    "month": ("substr(d.day, 1, 7)", "substr(d.day, 1, 7)"),
+}
+TIME_DIMENSIONS = ("day", "week", "month")
+
+def aggregate_sql(group_by, sources=0, types=0, since=False, until=False,
+                  running_total=False):
+    """Build the daily_totals GROUP BY query for aggregate(). sources and
+    types are the number of ids to filter on (0 for all); since/until
+    add day bounds. Placeholders follow the parameter order."""
+    unknown = [g for g in group_by if g not in AGGREGATE_DIMENSIONS]
+    if unknown or len(set(group_by)) != len(group_by):
+        raise ValueError(f"Bad group_by {tuple(group_by)!r}; choose from "
+                         f"{', '.join(AGGREGATE_DIMENSIONS)}")
+    values = [AGGREGATE_DIMENSIONS[g][0] for g in group_by]
+    columns = values + ["SUM(d.weight)", "SUM(d.count)"]
+    if running_total:
+        time_dims = [AGGREGATE_DIMENSIONS[g][0] for g in group_by if g in TIME_DIMENSIONS]
+        if not time_dims:
+            raise ValueError("running_total needs a day, week or month dimension")
+        partition = [AGGREGATE_DIMENSIONS[g][0] for g in group_by if g not in TIME_DIMENSIONS]
+        window = ("PARTITION BY " + ", ".join(partition) + " " if partition else "")
+        columns.append(f"SUM(SUM(d.weight)) OVER ({window}ORDER BY {', '.join(time_dims)})")
+
+    joins = []
+    if "source" in group_by:
+        joins.append("JOIN sources s ON s.id = d.source_id")
+    if "type" in group_by:
+        joins.append("JOIN types t ON t.id = d.type_id")
+    # Always constrain source_id, the first key of daily_totals, so every
+    # query is a set of primary-key range reads rather than a table scan.
+    where = [f"d.source_id IN ({', '.join('?' * sources)})" if sources
+             else "d.source_id IN (SELECT id FROM sources)"]
+    if types:
+        where.append(f"d.type_id IN ({', '.join('?' * types)})")
+    if since:
+        where.append("d.day >= ?")
+    if until:
+        where.append("d.day <= ?")
+    group = f"GROUP BY {', '.join(str(i + 1) for i in range(len(values)))}" if values else ""
+    order = f"ORDER BY {', '.join(AGGREGATE_DIMENSIONS[g][1] for g in group_by)}" if values else ""
+    return f"""
+    SELECT {", ".join(columns)}
+    FROM daily_totals d
+    {" ".join(joins)}
+    WHERE {" AND ".join(where)}
+    {group}
+    {order}
+    """
+
+@instrument()
+def aggregate(group_by=("source", "type"), start_date=None, end_date=None,
+              sources=None, types=None, running_total=False):
+    """Total recorded weight grouped by any of "source", "type", "day",
+    "week" (ISO) and "month", computed by SQLite from daily_totals in one
+    query. start_date/end_date are inclusive YYYY-MM-DD days (None for
+    unbounded); sources/types restrict to those names. With
+    running_total, each row also carries the cumulative weight along
+    its time dimension(s), per combination of the other dimensions.
+
+    Returns (columns, rows) where columns names the row fields, e.g.
+    ["source", "type", "weight_lb", "count"]. Results are cached until
+    the next write; treat them as read-only.
+    """
+    return _aggregate(tuple(group_by), start_date, end_date,
+                      tuple(sources or ()), tuple(types or ()), bool(running_total))
+
+@_memoized
+def _aggregate(group_by, start_date, end_date, sources, types, running_total):
+    source_ids = [resolve_id("sources", name) for name in sources]
+    type_ids = [resolve_id("types", name) for name in types]
+    sql = aggregate_sql(group_by, len(source_ids), len(type_ids),
+                        start_date is not None, end_date is not None, running_total)
+    params = [*source_ids, *type_ids]
+    params += [d for d in (start_date, end_date) if d is not None]
+    flush_pending()
+    sql = with_archives(sql, archive_schemas(start_date, end_date))
+    rows = connect().execute(sql, params).fetchall()
+    columns = [*group_by, "weight_lb", "count"] + (["running_weight_lb"] if running_total else [])
+    return columns, rows
+
+# Queries that run on every button press or report, with sample
+# parameters, for scale_logger.queryplan to EXPLAIN.
+_JAN_1, _FEB_1 = day_range_us("2025-01-01", "2025-01-31")
+_JAN_2 = day_range_us("2025-01-01")[1]
+_JAN_15 = epoch_us("2025-01-15T00:00")
+
+HOT_QUERIES = {
+    "delete_last_entry.last_record": (LAST_RECORD_SQL, ()),
+    "undelete_last_entry.last_delete": (LAST_TOMBSTONE_SQL, ()),
+    "iter_logs": (logs_page_sql(action=True, after=True, live=True), ("record", _JAN_15, 1, 500)),
+    "iter_logs.include_deleted": (logs_page_sql(after=True), (_JAN_15, 1, 500)),
+    "iter_logs.source": (logs_page_sql(source=True, action=True, since=True, until=True, after=True,
+                                       live=True),
+                         (1, "record", _JAN_1, _FEB_1, _JAN_15, 1, 500)),
+    "iter_logs.type": (logs_page_sql(dtype=True, action=True, after=True, live=True),
+                       (1, "record", _JAN_15, 1, 500)),
+    "iter_logs.range": (logs_page_sql(action=True, since=True, until=True, after=True, live=True),
+                        ("record", _JAN_1, _FEB_1, _JAN_15, 1, 500)),
+    "get_source_logs": (SOURCE_LOGS_SQL, (1, _JAN_1, _JAN_2)),
+    "export.range_rows": (RANGE_LOGS_SQL, (_JAN_1, _FEB_1)),
+    "export.range_count": (RANGE_COUNT_SQL, (_JAN_1, _FEB_1)),
+    "create_report.rows": (REPORT_ROWS_SQL, (1, _JAN_1, _JAN_2)),
+}
+
+# Hot queries over rollup tables. Their result size is bounded by
+# days x sources x types, so only table scans count against them; sorting
+# the grouped rows in a temp b-tree is fine.
+ROLLUP_QUERIES = {
+    "create_report.totals": (REPORT_TOTALS_SQL, (1, "2025-01-01", "2025-01-01")),
+    "totals.day": (DAY_TOTALS_SQL, ("2025-01-01",)),
+    "aggregate.source_type": (aggregate_sql(("source", "type"), since=True, until=True),
+                              ("2025-01-01", "2025-03-31")),
+    "aggregate.month_running": (aggregate_sql(("source", "month"), sources=2, running_total=True),
+                                (1, 2)),
+    "aggregate.type_week": (aggregate_sql(("week", "type"), types=1, since=True),
+                            (1, "2025-01-01")),
+}
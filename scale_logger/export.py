@@ -0,0 +1,114 @@
+"""
+export.py – per-source CSV export over a date range
+
+export_per_source_csvs() makes a single ordered pass over the recorded
+log rows in the range. Each row is appended to a spool file for its
+source while the per-category totals are summed on the fly; once the
+pass is done every source's CSV is written as
+
+    Summary by Category / type_name,total_weight_lb / ... / <blank> /
+    id,timestamp,weight_lb,source_name,type_name,action / rows ...
+
+Nothing here touches Tk, so the GUI can run it on a worker thread and
+the CLI can call it directly.
+"""
+
+import csv
+import os
+import shutil
+import tempfile
+
+from scale_logger import db
+
+PROGRESS_EVERY = 500
+
+HEADER = ["id", "timestamp", "weight_lb", "source_name", "type_name", "action"]
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class _SourceSpool:
+    def __init__(self):
+        self.file = tempfile.TemporaryFile("w+", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.totals = {}
+        self.rows = 0
+
+    def add(self, row):
+        self.writer.writerow(row)
+        tname, wt = row[4], row[2]
+        self.totals[tname] = self.totals.get(tname, 0.0) + float(wt or 0.0)
+        self.rows += 1
+
+    def write_csv(self, path):
+        tmp_path = path + ".part"
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Summary by Category"])
+            writer.writerow(["type_name", "total_weight_lb"])
+            for tname, total in self.totals.items():
+                writer.writerow([tname, f"{total:.1f}"])
+
+            writer.writerow([])
+            writer.writerow(HEADER)
+            self.file.seek(0)
+            shutil.copyfileobj(self.file, f)
+        os.replace(tmp_path, path)
+
+
+def csv_filename(source_name, start_date, end_date):
+    safe_src = source_name.replace(" ", "_")
+    return f"{safe_src}_{start_date}_to_{end_date}.csv"
+
+
+def count_rows(start_date, end_date):
+    bounds = db.day_range_us(start_date, end_date)
+    return sum(count for count, in db.execute_range(db.RANGE_COUNT_SQL, bounds, start_date, end_date))
+
+
+def export_per_source_csvs(start_date, end_date, out_dir, progress=None, cancel=None):
+    """Write one CSV per source with recorded entries between start_date and
+    end_date (inclusive YYYY-MM-DD) into out_dir.
+
+    progress(done, total) is called every PROGRESS_EVERY rows and at the
+    end. cancel is anything with an is_set() method (e.g. a
+    threading.Event); when it is set the export stops, leaves no files
+    behind and raises ExportCancelled.
+
+    Returns {source_name: (path, row_count, totals)} for the files written.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    db.flush_pending()
+    bounds = db.day_range_us(start_date, end_date)
+    total = count_rows(start_date, end_date) if progress else 0
+    spools = {}
+    done = 0
+    try:
+        for row in db.execute_range(db.RANGE_LOGS_SQL, bounds, start_date, end_date):
+            spool = spools.get(row[3])
+            if spool is None:
+                spool = spools[row[3]] = _SourceSpool()
+            spool.add(row)
+            done += 1
+            if done % PROGRESS_EVERY == 0:
+                if cancel is not None and cancel.is_set():
+                    raise ExportCancelled()
+                if progress:
+                    progress(done, total)
+
+        if cancel is not None and cancel.is_set():
+            raise ExportCancelled()
+        written = {}
+        for source_name in sorted(spools):
+            spool = spools[source_name]
+            path = os.path.join(out_dir, csv_filename(source_name, start_date, end_date))
+            spool.write_csv(path)
+            written[source_name] = (path, spool.rows, spool.totals)
+        if progress:
+            progress(done, max(total, done))
+        return written
+    finally:
+        for spool in spools.values():
+            spool.file.close()
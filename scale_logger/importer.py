@@ -0,0 +1,59 @@
+"""
+importer.py – stream CSV / JSONL weigh-in files into db.log_entries
+
+CSV files need a header row with weight, type and source columns
+(weight_lb / type_name / source_name also work) and may have a timestamp
+column. JSONL files hold one object per line with the same keys. Files
+are read lazily, so memory use doesn't grow with file size. Bad rows,
+including JSONL lines that don't parse, are reported and skipped.
+"""
+
+import csv
+import json
+import os
+import time
+
+from scale_logger import db
+
+FORMATS = ("csv", "jsonl")
+
+
+def detect_format(path):
+    ext = os.path.splitext(path)[1].lower().lstrip(".")
+    if ext == "json":
+        ext = "jsonl"
+    if ext not in FORMATS:
+        raise ValueError(f"Can't tell the format of {path!r}; use --format csv or jsonl")
+    return ext
+
+
+def read_csv_entries(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+
+def read_jsonl_entries(path):
+    """Yield one object per non-blank line. A line that isn't valid JSON
+    is yielded as a ValueError naming it, which db.log_entries reports as
+    that entry's failure, so one bad line doesn't stop the import."""
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield ValueError(f"Line {number}: {e}")
+
+
+def read_entries(path, fmt=None):
+    fmt = fmt or detect_format(path)
+    return read_csv_entries(path) if fmt == "csv" else read_jsonl_entries(path)
+
+
+def import_file(path, fmt=None):
+    """Load one file through db.log_entries in a single transaction.
+    Returns (inserted, failures, seconds)."""
+    start = time.perf_counter()
+    inserted, failures = db.log_entries(read_entries(path, fmt))
+    return inserted, failures, time.perf_counter() - start
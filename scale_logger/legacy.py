@@ -0,0 +1,151 @@
+"""
+legacy.py – migrate old_SLFPScale weights.csv files into the database
+
+The legacy app appended "Timestamp,KG,LB,Type,Source" rows to weights.csv
+and kept its source list in sources.json. import_legacy_csvs() streams any
+number of those files into logs in batched transactions:
+
+- missing sources are created,
+- type names are matched case-insensitively ("Non-food" -> "Non-Food"),
+- every row gets a content fingerprint, recorded in legacy_imports, so
+  importing the same file twice (or overlapping copies from different
+  stations) adds nothing the second time.
+
+Rows are read one at a time, so memory use does not depend on file size.
+The legacy app wrote in the station's locale encoding (cp1252 on the
+Windows stations), so each line is decoded as UTF-8 and, failing that,
+as FALLBACK_ENCODING; a line that is neither is reported with the other
+bad rows.
+"""
+
+import csv
+import hashlib
+import json
+import time
+from datetime import datetime
+
+from scale_logger import db
+
+BATCH_SIZE = 5000
+FALLBACK_ENCODING = "cp1252"
+
+
+def _ensure_table(conn):
+    with conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS legacy_imports (
+            fingerprint TEXT PRIMARY KEY
+        ) WITHOUT ROWID''')
+
+
+def load_sources_json(path):
+    """Add every source listed in a legacy sources.json."""
+    with open(path, encoding="utf-8") as f:
+        names = json.load(f)
+    for name in names:
+        db.add_source(name.strip())
+    return len(names)
+
+
+def _decode(raw, first):
+    try:
+        return raw.decode("utf-8-sig" if first else "utf-8")
+    except UnicodeDecodeError:
+        return raw.decode(FALLBACK_ENCODING)
+
+
+def iter_legacy_rows(path):
+    """Yield (line_number, row) for each data row of a legacy CSV. row is
+    a UnicodeDecodeError for a line that decodes in neither encoding."""
+    undecodable = {}
+
+    def lines(f):
+        for line_no, raw in enumerate(f, start=1):
+            try:
+                yield _decode(raw, line_no == 1)
+            except UnicodeDecodeError as e:
+                undecodable[line_no] = e
+                yield "\n"  # an empty row in its place
+
+    with open(path, "rb") as f:
+        reader = csv.reader(lines(f))
+        for row in reader:
+            line_no = reader.line_num
+            if line_no in undecodable:
+                yield line_no, undecodable.pop(line_no)
+            elif row and not (line_no == 1 and row[0] == "Timestamp"):
+                yield line_no, row
+
+
+def _fingerprint(ts, lb, dtype, source, repeat):
+    # The legacy app happily recorded the same item twice in a row (it only
+    # warned "Duplicate record"), so back-to-back identical rows are told
+    # apart by their position in the run.
+    key = "\x1f".join((ts, lb, dtype, source, str(repeat)))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def import_legacy_csvs(paths, batch_size=BATCH_SIZE, progress=None):
+    """Import legacy weights.csv files. progress(stats) is called after
+    every committed batch. Returns the final stats dict with files, rows,
+    imported, duplicates, errors (list of (path, line, message)) and
+    seconds."""
+    conn = db.connect()
+    _ensure_table(conn)
+    type_ids = {name.lower(): db.get_id_by_name("types", name) for name in db.get_types()}
+    stats = {"files": 0, "rows": 0, "imported": 0, "duplicates": 0,
+             "errors": [], "seconds": 0.0}
+    start = time.perf_counter()
+    pending = 0
+
+    for path in paths:
+        stats["files"] += 1
+        prev, repeat = None, 0
+        try:
+            for line_no, row in iter_legacy_rows(path):
+                stats["rows"] += 1
+                try:
+                    if isinstance(row, UnicodeDecodeError):
+                        raise ValueError(f"Can't decode line: {row}")
+                    ts, _kg, lb, dtype, source = (v.strip() for v in row[:5])
+                    weight = float(lb)
+                    timestamp = datetime.fromisoformat(ts).isoformat()
+                    type_id = type_ids.get(dtype.lower())
+                    if type_id is None:
+                        raise ValueError(f"Unknown type: {dtype!r}")
+                    if not source:
+                        raise ValueError("Missing source")
+                except ValueError as e:
+                    stats["errors"].append((path, line_no, str(e)))
+                    continue
+
+                content = (ts, lb, dtype, source)
+                repeat = repeat + 1 if content == prev else 0
+                prev = content
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO legacy_imports (fingerprint) VALUES (?)",
+                    (_fingerprint(ts, lb, dtype, source, repeat),))
+                if not cur.rowcount:
+                    stats["duplicates"] += 1
+                    continue
+
+                source_id = db.get_id_by_name("sources", source)
+                if source_id is None:
+                    db.add_source(source)  # commits the batch so far; rare
+                    source_id = db.resolve_id("sources", source)
+                conn.execute(db.INSERT_RECORD_SQL, (timestamp, weight, source_id, type_id))
+                stats["imported"] += 1
+                pending += 1
+
+                if pending >= batch_size:
+                    conn.commit()
+                    pending = 0
+                    stats["seconds"] = time.perf_counter() - start
+                    if progress:
+                        progress(stats)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    stats["seconds"] = time.perf_counter() - start
+    return stats
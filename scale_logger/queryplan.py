@@ -0,0 +1,44 @@
+"""
+queryplan.py – EXPLAIN QUERY PLAN regression check for the hot queries
+
+Every query listed in db.HOT_QUERIES must be answered from an index:
+a plan step that scans a whole table, or sorts rows in a temporary
+b-tree, is reported as a problem. Queries in db.ROLLUP_QUERIES only have
+to avoid table scans. tests/test_query_plans.py runs it against a fresh
+database, so `python -m pytest` fails on a plan regression; run it
+against a real database with `python cli.py check-plans`.
+"""
+
+import re
+
+from scale_logger import db
+
+# "SCAN logs" / "SCAN logs AS l" without "USING ... INDEX" is a full table
+# scan; "SCAN logs USING COVERING INDEX ..." walks an index in order and is
+# what we want for ORDER BY ... LIMIT queries.
+_TABLE_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+_TEMP_SORT = re.compile(r"^USE TEMP B-TREE FOR")
+
+
+def explain(sql, params=(), conn=None):
+    """Return the plan detail strings for sql."""
+    conn = conn or db.connect()
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def plan_problems(plan, allow_sort=False):
+    return [step for step in plan
+            if _TABLE_SCAN.match(step) or (not allow_sort and _TEMP_SORT.match(step))]
+
+
+def check_query_plans(conn=None):
+    """Return {query name: [offending plan steps]} for every hot query that
+    falls back to a table scan or a disallowed temporary sort. Empty means
+    all good."""
+    failures = {}
+    for queries, allow_sort in ((db.HOT_QUERIES, False), (db.ROLLUP_QUERIES, True)):
+        for name, (sql, params) in queries.items():
+            problems = plan_problems(explain(sql, params, conn), allow_sort)
+            if problems:
+                failures[name] = problems
+    return failures
@@ -0,0 +1,217 @@
+"""
+scale.py – scale input with stable-weight detection
+
+A backend pushes raw weights (in lb) from its own thread into a
+ScaleReader. The reader keeps the last few readings in a ring buffer to
+decide whether the weight has settled and publishes the result as one
+immutable Reading in a single attribute, so the UI can poll latest()
+as often as it likes without locks or a backlog of queued reports.
+
+Backends:
+- DymoHidBackend: DYMO S100 over USB HID (Windows, needs pywinusb)
+- ReplayBackend: replays a list or file of weights, for testing anywhere
+- SimulatedBackend: an endless loop of items being placed and removed
+
+open_default_reader() picks one from the FOODLOG_SCALE environment
+variable: "dymo", "sim", "replay:<file>" or "none".
+"""
+
+import os
+import random
+import struct
+import threading
+import time
+from collections import deque, namedtuple
+
+LB_PER_KG = 2.20462
+MIN_WEIGHT_LB = 0.11
+
+# A reading is "stable" once the last STABLE_WINDOW reports are all within
+# STABLE_TOLERANCE_LB of each other.
+STABLE_WINDOW = 5
+STABLE_TOLERANCE_LB = 0.02
+
+Reading = namedtuple("Reading", "lb kg stable seq time")
+
+
+def decode_dymo_report(raw_report):
+    """Decode a DYMO S100 HID report into (kg, lb)."""
+    _, _, unit, exp, lo, hi = struct.unpack("6B", bytes(raw_report[:6]))
+    if exp >= 128:
+        exp -= 256
+    raw = lo + (hi << 8)
+    if unit == 0x0C:  # pounds
+        lb = raw * (10 ** exp)
+        kg = lb / LB_PER_KG
+    else:             # kilograms
+        kg = raw * (10 ** exp)
+        lb = kg * LB_PER_KG
+    return kg, lb
+
+
+class ScaleBackend:
+    """Delivers weights in lb to on_weight(lb) from a background thread and
+    reports failures to on_error(message)."""
+
+    def start(self, on_weight, on_error):
+        raise NotImplementedError
+
+    def stop(self):
+        pass
+
+
+class DymoHidBackend(ScaleBackend):
+    VENDOR_ID = 0x0922
+    PRODUCT_ID = 0x8009
+
+    def __init__(self):
+        self.device = None
+
+    def start(self, on_weight, on_error):
+        try:
+            from pywinusb import hid
+            devs = hid.HidDeviceFilter(vendor_id=self.VENDOR_ID,
+                                       product_id=self.PRODUCT_ID).get_devices()
+            if not devs:
+                raise RuntimeError("DYMO S100 not found")
+            self.device = devs[0]
+            self.device.open()
+        except Exception as e:
+            on_error(str(e))
+            return
+        self.device.set_raw_data_handler(lambda raw: on_weight(decode_dymo_report(raw)[1]))
+
+    def stop(self):
+        if self.device is not None:
+            self.device.close()
+            self.device = None
+
+
+class ReplayBackend(ScaleBackend):
+    """Replays weights at a fixed interval. readings is an iterable of lb
+    values or a path to a file with one value per line."""
+
+    def __init__(self, readings, interval=0.05, loop=False):
+        self.readings = readings
+        self.interval = interval
+        self.loop = loop
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _values(self):
+        if isinstance(self.readings, str):
+            with open(self.readings, encoding="utf-8") as f:
+                return [float(line) for line in f if line.strip()]
+        return list(self.readings)
+
+    def start(self, on_weight, on_error):
+        try:
+            values = self._values()
+        except (OSError, ValueError) as e:
+            on_error(str(e))
+            return
+
+        def run():
+            while not self._stop.is_set():
+                for lb in values:
+                    if self._stop.wait(self.interval):
+                        return
+                    on_weight(lb)
+                if not self.loop:
+                    return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+class SimulatedBackend(ReplayBackend):
+    """Items being put on and taken off the pan, with a little jitter while
+    they settle."""
+
+    def __init__(self, interval=0.2, seed=None):
+        super().__init__(self._generate(random.Random(seed)), interval)
+
+    @staticmethod
+    def _generate(rng):
+        while True:
+            weight = round(rng.uniform(0.5, 40.0), 2)
+            for _ in range(rng.randint(2, 4)):
+                yield max(0.0, weight + rng.uniform(-1.5, 1.5))
+            for _ in range(rng.randint(8, 20)):
+                yield weight
+            for _ in range(rng.randint(5, 15)):
+                yield 0.0
+
+    def _values(self):
+        return self.readings
+
+
+class ScaleReader:
+    def __init__(self, backend, window=STABLE_WINDOW, tolerance_lb=STABLE_TOLERANCE_LB):
+        self.backend = backend
+        self.tolerance_lb = tolerance_lb
+        self.error = None
+        self._recent = deque(maxlen=window)
+        self._seq = 0
+        self._latest = None
+
+    def start(self):
+        self.backend.start(self._on_weight, self._on_error)
+        return self
+
+    def stop(self):
+        self.backend.stop()
+
+    def _on_error(self, message):
+        self.error = message
+
+    def _on_weight(self, lb):
+        # Runs on the backend thread only; readers just pick up _latest.
+        recent = self._recent
+        recent.append(lb)
+        stable = (len(recent) == recent.maxlen
+                  and max(recent) - min(recent) <= self.tolerance_lb)
+        self._seq += 1
+        self._latest = Reading(lb, lb / LB_PER_KG, stable, self._seq, time.monotonic())
+
+    def latest(self):
+        """The most recent Reading, or None before the first report."""
+        return self._latest
+
+    def stable_weight(self, min_lb=MIN_WEIGHT_LB):
+        """The settled weight in lb, or None if the pan is empty or the
+        weight is still moving."""
+        reading = self._latest
+        if reading is None or not reading.stable or reading.lb < min_lb:
+            return None
+        return reading.lb
+
+
+def open_default_reader():
+    """Start and return a ScaleReader chosen by FOODLOG_SCALE, or None for
+    manual weight entry. Without the variable the DYMO backend is used
+    when pywinusb is installed."""
+    choice = os.environ.get("FOODLOG_SCALE")
+    if choice is None:
+        try:
+            import pywinusb  # noqa: F401
+            choice = "dymo"
+        except ImportError:
+            choice = "none"
+    if choice == "none":
+        return None
+    if choice == "dymo":
+        backend = DymoHidBackend()
+    elif choice == "sim":
+        backend = SimulatedBackend()
+    elif choice.startswith("replay:"):
+        backend = ReplayBackend(choice[len("replay:"):], loop=True)
+    else:
+        raise ValueError(f"Unknown FOODLOG_SCALE backend: {choice!r}")
+    return ScaleReader(backend).start()
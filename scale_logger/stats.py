@@ -0,0 +1,255 @@
+"""
+stats.py – lightweight call counters and latency histograms
+
+@instrument("name") wraps a function so that, while stats are enabled,
+each call records its latency, whether it raised, and how many rows it
+returned (len() of a list/dict result, or the number of items a
+generator yields). timed("name") does the same for a block of code and
+record() takes a measurement made elsewhere, such as scale-to-commit
+latency. register_counters() adds counters a module keeps itself, such
+as the report cache's hits and misses, to every dump.
+
+Stats are off unless FOODLOG_STATS=1 or enable() is called; a disabled
+wrapper costs one flag check per call. start_dump() appends a JSON
+snapshot to a size-rotated file at a fixed interval, which is what
+`python cli.py stats` reads.
+"""
+
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# json and logging are imported where they are used: every module that
+# imports db imports this one, and short CLI runs shouldn't pay for them.
+
+DUMP_PATH = "scale_logger/stats.jsonl"
+DUMP_INTERVAL_S = 60
+DUMP_MAX_BYTES = 1_000_000
+DUMP_BACKUPS = 3
+
+# Histogram bucket upper bounds in milliseconds; the last bucket is open.
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+_enabled = os.environ.get("FOODLOG_STATS") == "1"
+_stats = {}
+_lock = threading.Lock()
+_counters = {}
+
+
+class _Stat:
+    __slots__ = ("calls", "errors", "total_ms", "max_ms", "rows", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, ms, rows, error):
+        self.calls += 1
+        self.errors += error
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        if rows:
+            self.rows += rows
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile call."""
+        target, seen = self.calls * p, 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= target:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else self.max_ms
+        return 0.0
+
+
+def enabled():
+    return _enabled
+
+
+def enable(flag=True):
+    global _enabled
+    _enabled = flag
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def record(name, seconds, rows=None, error=False):
+    ms = seconds * 1000
+    with _lock:
+        stat = _stats.get(name)
+        if stat is None:
+            stat = _stats[name] = _Stat()
+        stat.add(ms, rows, error)
+
+
+def _count_rows(result):
+    if isinstance(result, (list, dict)):
+        return len(result)
+    if isinstance(result, tuple) and result and isinstance(result[-1], list):
+        return len(result[-1])  # create_report's (totals, total, rows)
+    return None
+
+
+_CO_GENERATOR = 0x20  # inspect.CO_GENERATOR, without importing inspect
+
+
+def instrument(name=None):
+    def decorate(fn):
+        label = name or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__qualname__}"
+
+        if fn.__code__.co_flags & _CO_GENERATOR:
+            @functools.wraps(fn)
+            def gen_wrapper(*args, **kwargs):
+                if not _enabled:
+                    return (yield from fn(*args, **kwargs))
+                start, rows, error = time.perf_counter(), 0, False
+                try:
+                    for item in fn(*args, **kwargs):
+                        rows += 1
+                        yield item
+                except BaseException:
+                    error = True
+                    raise
+                finally:
+                    record(label, time.perf_counter() - start, rows, error)
+            return gen_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException:
+                record(label, time.perf_counter() - start, error=True)
+                raise
+            record(label, time.perf_counter() - start, _count_rows(result))
+            return result
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def timed(name):
+    if not _enabled:
+        yield
+        return
+    start, error = time.perf_counter(), False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        record(name, time.perf_counter() - start, error=error)
+
+
+def register_counters(name, fn):
+    """Include fn() -> {counter: value} under name in every dump, for
+    things that count themselves (such as cache hits)."""
+    _counters[name] = fn
+
+
+def counters():
+    return {name: fn() for name, fn in sorted(_counters.items())}
+
+
+def snapshot():
+    """{name: {calls, errors, mean_ms, p50_ms, p95_ms, p99_ms, max_ms, rows, buckets}}"""
+    with _lock:
+        return {
+            name: {
+                "calls": s.calls,
+                "errors": s.errors,
+                "mean_ms": round(s.total_ms / s.calls, 3) if s.calls else 0.0,
+                "p50_ms": s.percentile(0.50),
+                "p95_ms": s.percentile(0.95),
+                "p99_ms": s.percentile(0.99),
+                "max_ms": round(s.max_ms, 3),
+                "rows": s.rows,
+                "buckets": list(s.buckets),
+            }
+            for name, s in sorted(_stats.items())
+        }
+
+
+def format_table(snap):
+    lines = [f"{'name':<36} {'calls':>7} {'err':>4} {'mean ms':>9} {'p95 ms':>8} {'max ms':>9} {'rows':>9}"]
+    for name, s in snap.items():
+        lines.append(f"{name:<36} {s['calls']:>7} {s['errors']:>4} {s['mean_ms']:>9.3f} "
+                     f"{s['p95_ms']:>8.2f} {s['max_ms']:>9.3f} {s['rows']:>9}")
+    return "\n".join(lines)
+
+
+_dump_stop = None
+_dump_thread = None
+
+
+def start_dump(path=DUMP_PATH, interval_s=DUMP_INTERVAL_S,
+               max_bytes=DUMP_MAX_BYTES, backups=DUMP_BACKUPS):
+    """Append a snapshot line to path every interval_s seconds (and once
+    more on stop_dump()), rotating the file at max_bytes."""
+    global _dump_stop, _dump_thread
+    import json
+    import logging.handlers
+    stop_dump()
+    logger = logging.getLogger("scale_logger.stats.dump")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    logger.addHandler(logging.handlers.RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8"))
+
+    def dump():
+        logger.info(json.dumps({"time": time.time(), "pid": os.getpid(),
+                                "stats": snapshot(), "counters": counters()}))
+
+    stop = _dump_stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval_s):
+            dump()
+        dump()
+
+    _dump_thread = threading.Thread(target=run, name="stats-dump", daemon=True)
+    _dump_thread.start()
+
+
+def stop_dump():
+    """Stop the periodic dump after writing one last snapshot."""
+    global _dump_stop, _dump_thread
+    if _dump_stop is not None:
+        _dump_stop.set()
+        _dump_thread.join()
+        _dump_stop = _dump_thread = None
+
+
+def load_last_snapshot(path=DUMP_PATH):
+    """The most recent snapshot written by start_dump(), or None."""
+    import json
+    try:
+        with open(path, encoding="utf-8") as f:
+            last = None
+            for line in f:
+                if line.strip():
+                    last = line
+    except FileNotFoundError:
+        return None
+    return json.loads(last) if last else None
@@ -0,0 +1,293 @@
+"""
+sync.py – incremental sync between stations through change-set files
+
+Each database is a station with a random uid and a name (the host name
+unless set_station_name() says otherwise). A log row's global id is
+"<station uid>:<local id>" for rows logged here; rows that arrived from
+another station keep the id they were given there in logs.uid.
+
+export_changes(peer, out_dir) writes every log row added since the last
+export to that peer, plus the ids of rows removed since then (an undo
+removes a tombstone), as gzipped JSON-lines files of at most
+CHANGESET_ROWS rows. Carry them over on a shared folder or USB stick and
+run import_changes() on the other station. Only rows past the per-peer
+high-water mark in sync_peers are read, by rowid range, so a sync costs
+time in proportion to what is new rather than to the database size.
+
+Sources and types are merged by name, so their ids may differ between
+stations. Rows are deduplicated by global id, so importing a file twice,
+or receiving the same entries through two different stations, adds them
+once. Rows are forwarded, so a station can relay between two others.
+
+Each file names the range it covers. import_changes() refuses a file
+that would leave a gap in a stream, so lost files are noticed instead of
+silently leaving tombstones without their records.
+"""
+
+import gzip
+import json
+import os
+import socket
+import uuid
+
+from scale_logger import db
+
+CHANGESET_ROWS = 50_000
+FORMAT = 1
+
+
+def _ensure_tables(conn):
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(logs)")]
+    with conn:
+        if "uid" not in columns:
+            conn.execute("ALTER TABLE logs ADD COLUMN uid TEXT")
+        conn.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_logs_uid
+            ON logs(uid) WHERE uid IS NOT NULL''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS sync_station (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            uid TEXT NOT NULL,
+            name TEXT NOT NULL
+        )''')
+        conn.execute("INSERT OR IGNORE INTO sync_station (id, uid, name) VALUES (1, ?, ?)",
+                     (uuid.uuid4().hex, socket.gethostname()))
+        # Outgoing marks per destination, and the peer's uid once known.
+        conn.execute('''CREATE TABLE IF NOT EXISTS sync_peers (
+            name TEXT PRIMARY KEY,
+            uid TEXT,
+            sent_log_id INTEGER NOT NULL DEFAULT 0,
+            sent_removed_seq INTEGER NOT NULL DEFAULT 0
+        )''')
+        # Incoming marks per (origin station, destination name) stream.
+        conn.execute('''CREATE TABLE IF NOT EXISTS sync_streams (
+            origin TEXT NOT NULL,
+            dest TEXT NOT NULL,
+            log_id INTEGER NOT NULL DEFAULT 0,
+            removed_seq INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (origin, dest)
+        ) WITHOUT ROWID''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS sync_removed (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            uid TEXT NOT NULL
+        )''')
+        conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_logs_sync_removed
+            AFTER DELETE ON logs
+            BEGIN
+                INSERT INTO sync_removed (uid) VALUES (
+                    COALESCE(OLD.uid, (SELECT uid FROM sync_station WHERE id = 1) || ':' || OLD.id));
+            END''')
+
+
+def station():
+    """(uid, name) of this database."""
+    conn = db.connect()
+    _ensure_tables(conn)
+    return conn.execute("SELECT uid, name FROM sync_station WHERE id = 1").fetchone()
+
+
+def set_station_name(name):
+    conn = db.connect()
+    _ensure_tables(conn)
+    with conn:
+        conn.execute("UPDATE sync_station SET name = ? WHERE id = 1", (name,))
+
+
+def peers():
+    """[(name, uid, sent_log_id, sent_removed_seq)] for every known peer."""
+    conn = db.connect()
+    _ensure_tables(conn)
+    return conn.execute(
+        "SELECT name, uid, sent_log_id, sent_removed_seq FROM sync_peers ORDER BY name").fetchall()
+
+
+_CHANGES_SQL = """
+    SELECT l.id, COALESCE(l.uid, :me || ':' || l.id), l.timestamp, l.ts_us, l.utc_offset,
+           l.weight_lb, s.name, t.name, l.action,
+           CASE WHEN r.id IS NOT NULL THEN COALESCE(r.uid, :me || ':' || r.id) END
+    FROM logs l
+    CROSS JOIN sources s ON s.id = l.source_id
+    CROSS JOIN types t ON t.id = l.type_id
+    LEFT JOIN logs r ON r.id = l.ref_id
+    WHERE l.id > :after AND (:peer_uid IS NULL OR l.uid IS NULL OR l.uid NOT LIKE :peer_uid || ':%')
+    ORDER BY l.id
+    LIMIT :limit
+    """
+
+
+def _safe(name):
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+
+
+def _write_changeset(path, header, rows, removed):
+    tmp_path = path + ".part"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        f.write(json.dumps(header) + "\n")
+        for row in rows:
+            f.write(json.dumps(row, separators=(",", ":")) + "\n")
+        for uid in removed:
+            f.write(json.dumps({"removed": uid}) + "\n")
+    os.replace(tmp_path, path)
+
+
+def export_changes(peer, out_dir, batch_rows=CHANGESET_ROWS):
+    """Write everything added or removed since the last export to peer
+    into out_dir. Returns [(path, rows, removed)] for the files written,
+    empty if there was nothing new."""
+    db.flush_pending()
+    conn = db.connect()
+    _ensure_tables(conn)
+    me, my_name = conn.execute("SELECT uid, name FROM sync_station WHERE id = 1").fetchone()
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO sync_peers (name) VALUES (?)", (peer,))
+    peer_uid, after_id, after_removed = conn.execute(
+        "SELECT uid, sent_log_id, sent_removed_seq FROM sync_peers WHERE name = ?", (peer,)).fetchone()
+
+    # Everything up to these marks goes out in this export.
+    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM logs").fetchone()[0]
+    last_removed = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM sync_removed").fetchone()[0]
+    if last_id <= after_id and last_removed <= after_removed:
+        return []
+
+    os.makedirs(out_dir, exist_ok=True)
+    sources = db.get_sources()
+    types = conn.execute("SELECT name, sort_order FROM types ORDER BY sort_order, name").fetchall()
+    written = []
+    while True:
+        rows = conn.execute(_CHANGES_SQL, {"me": me, "after": after_id, "peer_uid": peer_uid,
+                                           "limit": batch_rows}).fetchall()
+        rows = [r for r in rows if r[0] <= last_id]
+        through_id = rows[-1][0] if rows else max(after_id, last_id)
+        final = len(rows) < batch_rows or through_id >= last_id
+        removed = []
+        if final:
+            removed = [uid for (uid,) in conn.execute(
+                "SELECT uid FROM sync_removed WHERE seq > ? AND seq <= ? ORDER BY seq",
+                (after_removed, last_removed))]
+        header = {
+            "format": FORMAT, "from": me, "from_name": my_name, "to": peer,
+            "after_id": after_id, "through_id": through_id,
+            "after_removed": after_removed,
+            "through_removed": last_removed if final else after_removed,
+            "sources": sources, "types": types,
+        }
+        path = os.path.join(out_dir, f"{_safe(my_name)}-to-{_safe(peer)}-"
+                                     f"{through_id:012d}-{header['through_removed']:06d}.jsonl.gz")
+        _write_changeset(path, header, [r[1:] for r in rows], removed)
+        with conn:
+            conn.execute("UPDATE sync_peers SET sent_log_id = ?, sent_removed_seq = ? WHERE name = ?",
+                         (through_id, header["through_removed"], peer))
+        written.append((path, len(rows), len(removed)))
+        after_id, after_removed = through_id, header["through_removed"]
+        if final:
+            return written
+
+
+def read_changeset(path):
+    """(header, rows, removed uids) from a change-set file."""
+    rows, removed = [], []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("format") != FORMAT:
+            raise ValueError(f"{path}: unsupported change-set format {header.get('format')!r}")
+        for line in f:
+            item = json.loads(line)
+            if isinstance(item, dict):
+                removed.append(item["removed"])
+            else:
+                rows.append(item)
+    return header, rows, removed
+
+
+def _ensure_names(conn, header):
+    for name in header["sources"]:
+        if db.get_id_by_name("sources", name) is None:
+            db.add_source(name)
+    for name, sort_order in header["types"]:
+        if db.get_id_by_name("types", name) is None:
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO types (name, sort_order) VALUES (?, ?)",
+                             (name, sort_order))
+
+
+_INSERT_SQL = """
+    INSERT OR IGNORE INTO logs
+        (uid, timestamp, ts_us, utc_offset, weight_lb, source_id, type_id, action, ref_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+
+
+def _local_id(conn, me, uid):
+    """Local logs.id for a global id, or None if this station hasn't got it."""
+    if uid.startswith(me + ":"):
+        return int(uid[len(me) + 1:])
+    row = conn.execute("SELECT id FROM logs WHERE uid = ?", (uid,)).fetchone()
+    return row[0] if row else None
+
+
+def _apply_changeset(conn, me, header, rows, removed):
+    inserted = 0
+    with conn:
+        for uid, ts, ts_us, utc_offset, weight, source, dtype, action, ref_uid in rows:
+            if uid.startswith(me + ":"):
+                continue  # our own row, relayed back
+            ref_id = _local_id(conn, me, ref_uid) if ref_uid else None
+            cur = conn.execute(_INSERT_SQL, (
+                uid, ts, ts_us, utc_offset, weight,
+                db.get_id_by_name("sources", source), db.get_id_by_name("types", dtype),
+                action, ref_id))
+            inserted += cur.rowcount
+        for uid in removed:
+            id_ = _local_id(conn, me, uid)
+            if id_ is not None:
+                conn.execute("DELETE FROM logs WHERE id = ?", (id_,))
+        conn.execute('''INSERT INTO sync_streams (origin, dest, log_id, removed_seq)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(origin, dest) DO UPDATE
+            SET log_id = excluded.log_id, removed_seq = excluded.removed_seq''',
+                     (header["from"], header["to"], header["through_id"], header["through_removed"]))
+        conn.execute('''INSERT INTO sync_peers (name, uid) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET uid = excluded.uid''',
+                     (header["from_name"], header["from"]))
+    return inserted
+
+
+def import_changes(paths):
+    """Apply change-set files, in stream order whatever order they are
+    given in. Files already applied are skipped; a file that would leave
+    a gap in its stream raises ValueError before anything from it is
+    applied.
+
+    Returns {"files", "skipped", "rows", "inserted", "removed"}.
+    """
+    db.flush_pending()
+    conn = db.connect()
+    _ensure_tables(conn)
+    me = conn.execute("SELECT uid FROM sync_station WHERE id = 1").fetchone()[0]
+
+    headers = []
+    for path in paths:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            headers.append((json.loads(f.readline()), path))
+    headers.sort(key=lambda hp: (hp[0]["from"], hp[0]["to"], hp[0]["after_id"], hp[0]["after_removed"]))
+
+    stats = {"files": 0, "skipped": 0, "rows": 0, "inserted": 0, "removed": 0}
+    for header, path in headers:
+        if header["from"] == me:
+            stats["skipped"] += 1
+            continue
+        mark = conn.execute("SELECT log_id, removed_seq FROM sync_streams WHERE origin = ? AND dest = ?",
+                            (header["from"], header["to"])).fetchone() or (0, 0)
+        if header["through_id"] <= mark[0] and header["through_removed"] <= mark[1]:
+            stats["skipped"] += 1
+            continue
+        if header["after_id"] > mark[0] or header["after_removed"] > mark[1]:
+            raise ValueError(
+                f"{path}: change set from {header['from_name']} starts after entry "
+                f"{header['after_id']}, but only entries up to {mark[0]} have been imported; "
+                "import the earlier change sets first")
+        header, rows, removed = read_changeset(path)
+        _ensure_names(conn, header)
+        stats["inserted"] += _apply_changeset(conn, me, header, rows, removed)
+        stats["files"] += 1
+        stats["rows"] += len(rows)
+        stats["removed"] += len(removed)
+    return stats
@@ -0,0 +1,252 @@
+"""
+totals.py – today's totals per source and category, kept in memory
+
+    model = totals.shared()
+    model.source_totals("Safeway")          # {"Dry": 12.5, ...}, no query
+    snapshot = model.subscribe(on_change)   # on_change(kind, data) from now on
+
+TotalsModel holds today's weight and entry count for every (source,
+type) cell. Once a day it reads them all with one grouped query on
+daily_totals. After that, each log, delete and undo made in this process
+arrives through db.add_listener() and is applied as a delta in O(1). It
+is applied on the writing thread before the db call returns, so a caller
+that has just logged an entry already sees it here.
+
+The model's thread does the rest:
+- It starts over when the date changes.
+- It re-reads the day's cells when PRAGMA data_version shows a write by
+  another process (checked every POLL_S), after a bulk insert, and at
+  least every RECONCILE_S in any case. Only the cells that differ are
+  reported to subscribers. data_version also moves for this process's
+  own writes from other threads; a move during a round in which deltas
+  arrived is taken to be those, so writes made here never cost a
+  re-read.
+
+Subscribers are called as fn(kind, data) while the model's lock is held,
+on whichever thread made the change, so keep them quick: put the change
+on a queue or set a flag. kind is "snapshot", where data is the whole
+table as snapshot() returns it (at startup and on a new day), or "cell",
+where data is [source, type, weight, count] with the cell's new values.
+
+The GUI, the daemon and the dashboard share one model per process
+through shared().
+"""
+
+import atexit
+import threading
+import time
+from datetime import date
+
+from scale_logger import db
+
+POLL_S = 1.0
+RECONCILE_S = 60
+
+
+class TotalsModel:
+    def __init__(self, poll_s=POLL_S, reconcile_s=RECONCILE_S):
+        self.poll_s = poll_s
+        self.reconcile_s = reconcile_s
+        self.day = None
+        self.sources = []
+        self.types = []
+        self.version = 0  # bumped on every change subscribers hear about
+        self._cells = {}  # (source, type) -> [weight, count]
+        self._subscribers = []
+        # Reentrant so that a subscriber may read the model.
+        self._lock = threading.RLock()
+        self._deltas = 0  # listener deltas applied; see _check() and _reconcile()
+        self._seen_deltas = 0  # _deltas at the previous check
+        self._data_version = None
+        self._reconciled = 0.0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._ready = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="totals-model", daemon=True)
+
+    def start(self):
+        """Load today's table and start following changes."""
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+        return self
+
+    def close(self):
+        db.remove_listener(self._on_change)
+        self._stop.set()
+        self._wake.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    # Reading
+
+    def snapshot(self):
+        """{"day", "sources", "types", "cells": [[source, type, weight, count], ...]}"""
+        with self._lock:
+            return {"day": self.day, "sources": list(self.sources), "types": list(self.types),
+                    "cells": [[s, t, round(w, 2), c] for (s, t), (w, c) in self._cells.items()]}
+
+    def source_totals(self, source):
+        """{type: weight} for source today, in the types' display order."""
+        with self._lock:
+            totals = {t: w for (s, t), (w, c) in self._cells.items() if s == source}
+            order = {t: i for i, t in enumerate(self.types)}
+        return dict(sorted(totals.items(), key=lambda item: order.get(item[0], len(order))))
+
+    def subscribe(self, fn):
+        """Call fn(kind, data) for every change from now on. Returns the
+        current snapshot, taken atomically with the subscription."""
+        with self._lock:
+            self._subscribers.append(fn)
+            return self.snapshot()
+
+    def unsubscribe(self, fn):
+        with self._lock:
+            if fn in self._subscribers:
+                self._subscribers.remove(fn)
+
+    def _publish(self, kind, data):
+        self.version += 1
+        for fn in list(self._subscribers):
+            try:
+                fn(kind, data)
+            except Exception as e:
+                print(f"⚠️ totals subscriber {fn!r} failed: {e}")
+
+    # Deltas, on the writing thread
+
+    def _on_change(self, event):
+        if event["action"] == "bulk":
+            self._data_version = None  # reconcile on the next wake-up
+            self._wake.set()
+            return
+        key = (event["source"], event["type"])
+        with self._lock:
+            if event["day"] != self.day:
+                return
+            self._deltas += 1
+            cell = self._cells.setdefault(key, [0.0, 0])
+            cell[0] += event["weight"]
+            cell[1] += event["count"]
+            if cell[1] <= 0:
+                del self._cells[key]
+                cell = [0.0, 0]
+            self._publish("cell", [*key, round(cell[0], 2), cell[1]])
+
+    # Reconciling, on the model's thread. Every read happens here:
+    # data_version is counted per connection, and db.connect() gives each
+    # thread its own.
+
+    def _run(self):
+        try:
+            # Read the table before listening: a change missed in between
+            # still moves data_version, while one counted twice would not.
+            self._reload()
+            db.add_listener(self._on_change)
+        except Exception as e:
+            self._error = e
+            return
+        finally:
+            self._ready.set()
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_s)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self._check()
+            except Exception as e:
+                print(f"⚠️ totals reconcile failed: {e}")
+
+    def _check(self):
+        if date.today().isoformat() != self.day:
+            self._reload()
+            return
+        deltas = self._deltas
+        data_version = self._current_data_version()
+        moved = data_version != self._data_version
+        if moved and self._data_version is not None and deltas != self._seen_deltas:
+            # This process wrote since the last check, on another thread
+            # and so another connection, and those writes are already
+            # applied as deltas. A write by another process in the same
+            # round waits for the next RECONCILE_S.
+            self._data_version = data_version
+        elif moved or time.monotonic() - self._reconciled >= self.reconcile_s:
+            self._reconcile()
+        self._seen_deltas = deltas
+
+    def _current_data_version(self):
+        return db.connect().execute("PRAGMA data_version").fetchone()[0]
+
+    def _read_cells(self, day):
+        self._data_version = self._current_data_version()
+        self._reconciled = time.monotonic()
+        rows, pending = db._read_with_pending(lambda conn: conn.execute(db.DAY_TOTALS_SQL, (day,)).fetchall())
+        cells = {(s, t): [w, c] for s, t, w, c in rows}
+        # Entries acknowledged in batched mode but not committed yet.
+        for e in pending:
+            if e["ts"][:10] == day:
+                cell = cells.setdefault((e["source"], e["type"]), [0.0, 0])
+                cell[0] += e["weight"]
+                cell[1] += 1
+        return cells
+
+    def _reload(self):
+        """Start over for a new day (or at startup): fresh names and cells."""
+        day = date.today().isoformat()
+        sources, types = db.get_sources(), db.get_types()
+        cells = self._read_cells(day)
+        with self._lock:
+            # Deltas dated day were ignored until now. One that committed
+            # after the read still moved data_version, so the next check
+            # picks it up.
+            self.day, self.sources, self.types, self._cells = day, sources, types, cells
+            self._publish("snapshot", self.snapshot())
+
+    def _reconcile(self):
+        """Re-read today's cells and report the ones that changed."""
+        with self._lock:
+            deltas = self._deltas
+        cells = self._read_cells(self.day)
+        with self._lock:
+            if self._deltas != deltas:
+                # A delta landed while we were reading, and the read may
+                # or may not include it. Keep the deltas and look again
+                # on the next round.
+                self._data_version = None
+                return
+            for key in self._cells.keys() | cells.keys():
+                old = self._cells.get(key, [0.0, 0])
+                new = cells.get(key, [0.0, 0])
+                if old[1] != new[1] or abs(old[0] - new[0]) > 1e-6:
+                    self._publish("cell", [*key, round(new[0], 2), new[1]])
+            self._cells = cells
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared():
+    """This process's model, started on first use. Reads the database the
+    first time, so the GUI calls it off the Tk thread."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = TotalsModel().start()
+        return _shared
+
+
+def close_shared():
+    """Stop the shared model. Call it before db.close(); it also runs at
+    exit, ahead of db's own cleanup."""
+    global _shared
+    with _shared_lock:
+        model, _shared = _shared, None
+    if model is not None:
+        model.close()
+
+
+atexit.register(close_shared)
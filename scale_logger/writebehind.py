@@ -0,0 +1,233 @@
+"""
+writebehind.py – batched-durability mode for db.log_entry
+
+In batched mode a logged entry is appended to a local journal file
+(one JSON object per line) and acknowledged straight away; a background
+thread group-commits queued entries to SQLite once BATCH_SIZE of them
+are waiting or FLUSH_MS after the first one arrived, whichever comes
+first.
+
+Every journal line carries a sequence number, and the highest number
+committed to the database is stored in the write_behind table in the
+same transaction as the rows themselves. Each commit reads that number
+inside its own write transaction and skips entries at or below it.
+replay_journal() (run by db.initialize_db) applies any journalled
+entries above it, so an entry acknowledged before a crash is written
+exactly once. The journal is truncated whenever everything in it has
+been committed.
+
+The journal belongs to one process at a time. A WriteBehindLog holds an
+exclusive lock on JOURNAL + LOCK_SUFFIX for as long as it runs, and
+replay_journal() leaves a journal alone while another process holds it:
+that process commits its own entries.
+
+Journal lines are flushed to the OS on every entry, which survives the
+application crashing; pass fsync=True to also survive power loss at the
+cost of an fsync per entry.
+"""
+
+import json
+import os
+import threading
+import time
+
+from scale_logger import db
+
+BATCH_SIZE = 25
+FLUSH_MS = 500
+LOCK_SUFFIX = ".lock"
+
+
+class JournalInUse(OSError):
+    """Another process is logging in batched mode to the same database."""
+
+
+def _lock_journal(path):
+    """An open lock file for journal path, locked exclusively, or None if
+    another process holds it. Closing the file releases the lock."""
+    f = open(path + LOCK_SUFFIX, "a+")
+    try:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def _ensure_table(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS write_behind (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        applied_seq INTEGER NOT NULL
+    )''')
+    conn.execute("INSERT OR IGNORE INTO write_behind (id, applied_seq) VALUES (1, 0)")
+
+
+def _applied_seq(conn):
+    return conn.execute("SELECT applied_seq FROM write_behind WHERE id = 1").fetchone()[0]
+
+
+def _apply(conn, entries):
+    """Insert journal entries and advance applied_seq in one transaction,
+    skipping entries already applied. Entries whose names no longer
+    resolve are dropped. Returns the number of entries applied."""
+    with conn:
+        # IMMEDIATE takes the write lock before applied_seq is read, so no
+        # other connection can apply the same entries in between.
+        conn.execute("BEGIN IMMEDIATE")
+        applied = _applied_seq(conn)
+        entries = [e for e in entries if e["seq"] > applied]
+        if not entries:
+            return 0
+        rows = []
+        for e in entries:
+            source_id = db.get_id_by_name("sources", e["source"])
+            type_id = db.get_id_by_name("types", e["type"])
+            if source_id is not None and type_id is not None:
+                rows.append((e["ts"], e["weight"], source_id, type_id))
+        conn.executemany(db.INSERT_RECORD_SQL, rows)
+        conn.execute("UPDATE write_behind SET applied_seq = MAX(applied_seq, ?) WHERE id = 1",
+                     (entries[-1]["seq"],))
+    return len(entries)
+
+
+def _read_journal(path):
+    entries = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    break  # torn last line from a crash mid-write
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def replay_journal(path):
+    """Commit journalled entries that never reached the database, then
+    truncate the journal. Returns the number of entries replayed, or 0
+    without touching the journal while another process owns it."""
+    lock = _lock_journal(path)
+    if lock is None:
+        return 0
+    try:
+        return _replay(path)
+    finally:
+        lock.close()
+
+
+def _replay(path):
+    conn = db.connect()
+    with conn:
+        _ensure_table(conn)
+    entries = _read_journal(path)
+    replayed = _apply(conn, entries) if entries else 0
+    if os.path.exists(path):
+        open(path, "w").close()
+    return replayed
+
+
+class WriteBehindLog:
+    def __init__(self, journal_path, batch_size=BATCH_SIZE, flush_ms=FLUSH_MS, fsync=False):
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+        self.fsync = fsync
+
+        self._lock_file = _lock_journal(journal_path)
+        if self._lock_file is None:
+            raise JournalInUse(f"Another process is logging to {journal_path} in batched mode")
+        try:
+            _replay(journal_path)
+            self._seq = _applied_seq(db.connect())
+        except BaseException:
+            self._lock_file.close()
+            raise
+        self._pending = []
+        self._journal = open(journal_path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        # Held while committing, so the writer thread and flush() never
+        # apply the same entries twice.
+        self._commit_lock = threading.Lock()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def submit(self, ts, weight, dtype, source):
+        """Journal one entry and queue it for the next group commit."""
+        with self._lock:
+            self._seq += 1
+            entry = {"seq": self._seq, "ts": ts, "weight": weight, "type": dtype, "source": source}
+            self._journal.write(json.dumps(entry) + "\n")
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+            self._pending.append(entry)
+            if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+                self._wakeup.notify()
+        return entry
+
+    def pending_entries(self):
+        """Entries acknowledged but not yet committed, oldest first."""
+        with self._lock:
+            return list(self._pending)
+
+    def flush(self):
+        """Commit everything queued so far before returning."""
+        self._commit_pending()
+
+    def _commit_pending(self):
+        with self._commit_lock:
+            with self._lock:
+                batch = list(self._pending)
+            if not batch:
+                return
+            _apply(db.connect(), batch)
+            with self._lock:
+                # Only this method removes entries, and submit() only
+                # appends, so the committed batch is still the prefix.
+                del self._pending[:len(batch)]
+                if not self._pending:
+                    self._journal.truncate(0)
+                    self._journal.seek(0)
+            # Reports cached while the batch was still queued overlaid it
+            # from the queue; make sure none outlives the queue changing.
+            db._bump()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._pending and not self._stopping:
+                    self._wakeup.wait()
+                if len(self._pending) < self.batch_size and not self._stopping:
+                    self._wakeup.wait(self.flush_ms / 1000)
+                stopping = self._stopping
+            try:
+                self._commit_pending()
+            except Exception as e:
+                # Entries stay queued and journalled; retry on the next round.
+                print(f"⚠️ write-behind commit failed: {e}")
+                if not stopping:
+                    time.sleep(self.flush_ms / 1000)
+            if stopping:
+                return
+
+    def close(self):
+        """Commit what is queued, stop the writer thread and close the journal."""
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify()
+        self._thread.join()
+        try:
+            self._commit_pending()
+        finally:
+            self._journal.close()
+            self._lock_file.close()
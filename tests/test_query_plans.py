@@ -0,0 +1,38 @@
+"""
+Fails when a hot query's plan falls back to a table scan (or a temporary
+sort where none is allowed); see scale_logger/queryplan.py.
+
+    python -m pytest tests            # or: python -m unittest discover tests
+"""
+
+import os
+import tempfile
+import unittest
+
+from scale_logger import db, queryplan
+
+
+class QueryPlanTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.saved_path = db.DB_PATH
+        db.close()
+        db.DB_PATH = os.path.join(self.tmpdir.name, "foodlog.db")
+        db.initialize_db()
+
+    def tearDown(self):
+        db.close()
+        db.DB_PATH = self.saved_path
+        self.tmpdir.cleanup()
+
+    def test_hot_queries_use_indexes(self):
+        self.assertEqual(queryplan.check_query_plans(), {})
+
+    def test_missing_index_is_reported(self):
+        db.connect().execute("DROP INDEX idx_logs_us")
+        failures = queryplan.check_query_plans()
+        self.assertIn("SCAN logs", failures.get("iter_logs.include_deleted", []))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+"""
+Batched durability writes every acknowledged entry exactly once, even
+when another process opens the database while entries are queued; see
+scale_logger/writebehind.py.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from scale_logger import db, writebehind
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class WriteBehindTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.saved_path = db.DB_PATH
+        db.close()
+        db.DB_PATH = os.path.join(self.tmpdir.name, "foodlog.db")
+        db.initialize_db()
+        self.source = db.get_sources()[0]
+        self.dtype = db.get_types()[0]
+        # Nothing is committed until flush_pending() or close().
+        db.set_durability("batched", batch_size=1000, flush_ms=60_000)
+
+    def tearDown(self):
+        db.set_durability("strict")
+        db.close()
+        db.DB_PATH = self.saved_path
+        self.tmpdir.cleanup()
+
+    def records(self):
+        return db.connect().execute("SELECT COUNT(*) FROM logs WHERE action = 'record'").fetchone()[0]
+
+    def test_other_process_leaves_live_journal_alone(self):
+        db.log_entry(2.0, self.dtype, self.source)
+        env = dict(os.environ, FOODLOG_DB=db.DB_PATH, FOODLOG_DURABILITY="strict")
+        subprocess.run([sys.executable, "-c", "from scale_logger import db; db.initialize_db()"],
+                       cwd=REPO, env=env, check=True)
+        db.flush_pending()
+        self.assertEqual(self.records(), 1)
+        self.assertEqual(db.create_report(self.source, include_rows=False)[1], 2.0)
+
+    def test_second_batched_writer_is_refused(self):
+        with self.assertRaises(writebehind.JournalInUse):
+            writebehind.WriteBehindLog(db.DB_PATH + db.JOURNAL_SUFFIX)
+
+    def test_apply_skips_applied_entries(self):
+        entry = db._write_behind.submit("2025-05-01T10:00:00", 2.0, self.dtype, self.source)
+        db.flush_pending()
+        self.assertEqual(writebehind._apply(db.connect(), [entry]), 0)
+        self.assertEqual(self.records(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()